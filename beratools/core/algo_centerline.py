@@ -14,16 +14,19 @@ Description:
     for centerline tool.
 """
 import enum
+import math
 from itertools import compress
 
 import geopandas as gpd
 import numpy as np
-import pandas as pd
 import rasterio
+import rasterio.features as ras_feat
 import shapely
 import shapely.geometry as sh_geom
 import shapely.ops as sh_ops
-from label_centerlines import get_centerline
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
+from skimage import measure
 
 import beratools.core.algo_common as algo_common
 import beratools.core.algo_cost as algo_cost
@@ -47,7 +50,7 @@ class CenterlineStatus(enum.IntEnum):
     REGENERATE_SUCCESS = 3
     REGENERATE_FAILED = 4
 
-def centerline_is_valid(centerline, input_line):
+def centerline_is_valid(centerline, input_line, endpoints=None):
     """
     Check if centerline is valid.
 
@@ -55,6 +58,7 @@ def centerline_is_valid(centerline, input_line):
         centerline (_type_): _description_
         input_line (sh_geom.LineString): Seed line or least cost path.
         Only two end points are used.
+        endpoints (np.ndarray): Optional precomputed end points of input_line.
 
     Returns:
         bool: True if line is valid
@@ -63,19 +67,146 @@ def centerline_is_valid(centerline, input_line):
     if not centerline:
         return False
 
+    if endpoints is None:
+        coords = shapely.get_coordinates(input_line)
+        endpoints = shapely.points(coords[[0, -1]])
+
     # centerline length less the half of least cost path
     if (
         centerline.length < input_line.length / 2
-        or centerline.distance(sh_geom.Point(input_line.coords[0]))
-        > bt_const.BT_EPSILON
-        or centerline.distance(sh_geom.Point(input_line.coords[-1]))
-        > bt_const.BT_EPSILON
+        or shapely.distance(centerline, endpoints).max() > bt_const.BT_EPSILON
     ):
         return False
 
     return True
 
 
+def _longest_path(skeleton):
+    """
+    Find the longest path in the skeleton from Voronoi edges.
+
+    The skeleton of a polygon without holes is a tree, so the longest path
+    is found by two Dijkstra sweeps: the farthest node from any node is one
+    end of the longest path, and the farthest node from it is the other end.
+
+    Args:
+        skeleton (sh_geom.MultiLineString): merged Voronoi edges
+
+    Returns:
+        np.ndarray: coordinates of the longest path
+
+    """
+    parts = [i for i in shapely.get_parts(skeleton) if not i.is_closed]
+    if not parts:
+        return None
+
+    part_coords = [shapely.get_coordinates(i) for i in parts]
+    ends = np.array([[i[0], i[-1]] for i in part_coords]).reshape(-1, 2)
+    _, node_ids = np.unique(ends, axis=0, return_inverse=True)
+    node_ids = node_ids.reshape(-1, 2)
+    node_count = node_ids.max() + 1
+
+    # keep the shortest part between the same pair of nodes
+    edges = {}
+    for i, (u, v) in enumerate(node_ids):
+        key = (min(u, v), max(u, v))
+        if key not in edges or parts[i].length < parts[edges[key]].length:
+            edges[key] = i
+
+    u, v = np.array(list(edges.keys())).T
+    weights = [parts[i].length for i in edges.values()]
+    graph = sparse.csr_matrix((weights, (u, v)), shape=(node_count, node_count))
+
+    dist = csgraph.dijkstra(graph, directed=False, indices=u[0])
+    src = np.argmax(np.where(np.isinf(dist), -1, dist))
+    dist, pred = csgraph.dijkstra(
+        graph, directed=False, indices=src, return_predecessors=True
+    )
+    dst = np.argmax(np.where(np.isinf(dist), -1, dist))
+
+    path = [dst]
+    while path[-1] != src:
+        path.append(pred[path[-1]])
+
+    if len(path) < 2:
+        return None
+
+    path.reverse()
+    path_coords = []
+    for prev, node in zip(path[:-1], path[1:]):
+        part = edges[(min(prev, node), max(prev, node))]
+        coords = part_coords[part]
+        if node_ids[part][0] != prev:
+            coords = coords[::-1]
+
+        path_coords.append(coords[1:] if path_coords else coords)
+
+    return np.vstack(path_coords)
+
+
+def get_centerline(poly, smooth_sigma=CenterlineParams.SMOOTH_SIGMA):
+    """
+    Get centerline of polygon from Voronoi edges of its boundary.
+
+    Args:
+        poly (sh_geom.Polygon | sh_geom.MultiPolygon): corridor polygon
+        smooth_sigma (float): sigma of gaussian filter to smooth centerline
+
+    Returns:
+        sh_geom.LineString | sh_geom.MultiLineString: centerline,
+        None if no centerline is found
+
+    """
+    if type(poly) is sh_geom.MultiPolygon:
+        centerlines = [get_centerline(i, smooth_sigma) for i in poly.geoms]
+        centerlines = [i for i in centerlines if i]
+        if not centerlines:
+            return None
+
+        return sh_geom.MultiLineString(centerlines)
+
+    borders = shapely.segmentize(poly.exterior, CenterlineParams.SEGMENTIZE_LENGTH)
+    edges = shapely.voronoi_polygons(
+        sh_geom.MultiPoint(shapely.get_coordinates(borders)), only_edges=True
+    )
+
+    # keep Voronoi edges inside polygon only
+    edges_gdf = gpd.GeoDataFrame(geometry=shapely.get_parts(edges))
+    poly_gdf = gpd.GeoDataFrame(geometry=[poly])
+    edges_gdf = edges_gdf.sjoin(poly_gdf, predicate="within")
+    if edges_gdf.empty:
+        return None
+
+    return _edges_to_centerline(edges_gdf.geometry.values, smooth_sigma)
+
+
+def _edges_to_centerline(edges, smooth_sigma):
+    """
+    Merge Voronoi edges inside polygon and smooth their longest path.
+
+    Args:
+        edges (array_like): Voronoi edges inside corridor polygon
+        smooth_sigma (float): sigma of gaussian filter to smooth centerline
+
+    Returns:
+        sh_geom.LineString: centerline, None if no centerline is found
+
+    """
+    skeleton = sh_ops.linemerge(sh_ops.unary_union(edges))
+    if type(skeleton) is sh_geom.LineString:
+        path_coords = shapely.get_coordinates(skeleton)
+    else:
+        path_coords = _longest_path(skeleton)
+
+    if path_coords is None or len(path_coords) < 2:
+        return None
+
+    if smooth_sigma:
+        path_coords = ndimage.gaussian_filter1d(path_coords, smooth_sigma, axis=0)
+
+    return sh_geom.LineString(path_coords)
+
+
 def snap_end_to_end(in_line, line_reference):
     if type(in_line) is sh_geom.MultiLineString:
         in_line = sh_ops.linemerge(in_line)
@@ -83,27 +214,24 @@ def snap_end_to_end(in_line, line_reference):
             print(f'algo_centerline: MultiLineString found {in_line.centroid}, pass.')
             return None
 
-    pts = list(in_line.coords)
+    pts = shapely.get_coordinates(in_line, include_z=in_line.has_z)
     if len(pts) < 2:
         print('snap_end_to_end: input line invalid.')
         return in_line
 
-    line_start = sh_geom.Point(pts[0])
-    line_end = sh_geom.Point(pts[-1])
-    ref_ends = sh_geom.MultiPoint([line_reference.coords[0], line_reference.coords[-1]])
+    ref_coords = shapely.get_coordinates(line_reference, include_z=line_reference.has_z)
+    ref_ends = ref_coords[[0, -1]]
 
-    _, snap_start = sh_ops.nearest_points(line_start, ref_ends)
-    _, snap_end = sh_ops.nearest_points(line_end, ref_ends)
+    # nearest reference end of each line end
+    dist_sq = np.sum((pts[[0, -1], None, :2] - ref_ends[None, :, :2]) ** 2, axis=2)
+    snap_pts = shapely.points(ref_ends[np.argmin(dist_sq, axis=1)])
 
     if in_line.has_z:
-        snap_start = shapely.force_3d(snap_start)
-        snap_end = shapely.force_3d(snap_end)
+        snap_pts = shapely.force_3d(snap_pts)
     else:
-        snap_start = shapely.force_2d(snap_start)
-        snap_end = shapely.force_2d(snap_end)
+        snap_pts = shapely.force_2d(snap_pts)
 
-    pts[0] = snap_start.coords[0]
-    pts[-1] = snap_end.coords[0]
+    pts[[0, -1]] = shapely.get_coordinates(snap_pts, include_z=in_line.has_z)
 
     return sh_geom.LineString(pts)
 
@@ -126,57 +254,55 @@ def find_centerline(poly, input_line):
         print('find_centerline: No polygon found')
         return default_return
 
-    poly = shapely.segmentize(
-        poly, max_segment_length=CenterlineParams.SEGMENTIZE_LENGTH
-    )
-
     # buffer to reduce MultiPolygons
-    poly = poly.buffer(bt_const.SMALL_BUFFER)  
     if type(poly) is sh_geom.MultiPolygon:
-        print('sh_geom.MultiPolygon encountered, skip.')
-        return default_return
+        poly = poly.buffer(bt_const.SMALL_BUFFER)
+        if type(poly) is sh_geom.MultiPolygon:
+            print('sh_geom.MultiPolygon encountered, skip.')
+            return default_return
 
-    exterior_pts = list(poly.exterior.coords)
+    # only the boundary needs densifying
+    exterior = shapely.segmentize(
+        poly.exterior, max_segment_length=CenterlineParams.SEGMENTIZE_LENGTH
+    )
 
     if bt_const.CenterlineFlags.DELETE_HOLES:
-        poly = sh_geom.Polygon(exterior_pts)
+        poly = sh_geom.Polygon(exterior)
+    else:
+        poly = sh_geom.Polygon(exterior, poly.interiors)
     if bt_const.CenterlineFlags.SIMPLIFY_POLYGON:
         poly = poly.simplify(CenterlineParams.SIMPLIFY_LENGTH)
 
-    line_coords = list(input_line.coords)
-
-    # TODO add more code to filter Voronoi vertices
-    src_geom = (
-        sh_geom.Point(line_coords[0])
-        .buffer(CenterlineParams.BUFFER_CLIP * 3)
-        .intersection(poly)
-    )
-    dst_geom = (
-        sh_geom.Point(line_coords[-1])
-        .buffer(CenterlineParams.BUFFER_CLIP * 3)
-        .intersection(poly)
-    )
-    src_geom = None
-    dst_geom = None
-
     try:
-        centerline = get_centerline(
-            poly,
-            segmentize_maxlen=1,
-            max_points=3000,
-            simplification=0.05,
-            smooth_sigma=CenterlineParams.SMOOTH_SIGMA,
-            max_paths=1,
-            src_geom=src_geom,
-            dst_geom=dst_geom,
-        )
+        centerline = get_centerline(poly, CenterlineParams.SMOOTH_SIGMA)
     except Exception as e:
         print(f'find_centerline: {e}')
         return default_return
 
+    return _finish_centerline(centerline, poly, input_line)
+
+
+def _finish_centerline(centerline, poly, input_line):
+    """
+    Trim and snap centerline to input line, regenerate it if not valid.
+
+    Args:
+        centerline (sh_geom.LineString): Raw centerline from Voronoi edges
+        poly (sh_geom.Polygon): Prepared corridor polygon
+        input_line (sh_geom.LineString): Least cost path or seed line
+
+    Returns:
+    centerline (sh_geom.LineString): Centerline
+    status (CenterlineStatus): Status of centerline generation
+
+    """
+    default_return = input_line, CenterlineStatus.FAILED
     if not centerline:
         return default_return
 
+    line_coords = shapely.get_coordinates(input_line)
+    endpoints = shapely.points(line_coords[[0, -1]])
+
     if type(centerline) is sh_geom.MultiLineString:
         if len(centerline.geoms) > 1:
             print(" Multiple centerline segments detected, no further processing.")
@@ -186,33 +312,26 @@ def find_centerline(poly, input_line):
         else:
             return default_return
 
-    cl_coords = list(centerline.coords)
+    cl_coords = shapely.get_coordinates(centerline, include_z=centerline.has_z)
 
     # trim centerline at two ends
-    head_buffer = sh_geom.Point(cl_coords[0]).buffer(
-        CenterlineParams.BUFFER_CLIP
-    )
-    centerline = centerline.difference(head_buffer)
-
-    end_buffer = sh_geom.Point(cl_coords[-1]).buffer(
-        CenterlineParams.BUFFER_CLIP
-    )
-    centerline = centerline.difference(end_buffer)
-
-    # No centerline detected, use input line instead.
-    if not centerline:
+    clip_sq = CenterlineParams.BUFFER_CLIP**2
+    head_far = np.sum((cl_coords[:, :2] - cl_coords[0, :2]) ** 2, axis=1) > clip_sq
+    end_far = np.sum((cl_coords[:, :2] - cl_coords[-1, :2]) ** 2, axis=1) > clip_sq
+    head = np.argmax(head_far)
+    end = len(cl_coords) - 1 - np.argmax(end_far[::-1])
+
+    # No centerline left after trimming, use input line instead.
+    if not head_far.any() or not end_far.any() or end < head:
         return default_return
-    try:
-        # Empty centerline detected, use input line instead.
-        if centerline.is_empty:
-            return default_return
-    except Exception as e:
-        print(f'find_centerline: {e}')
+
+    # keep the last vertex inside each clip circle, it is snapped to line ends
+    centerline = sh_geom.LineString(cl_coords[head - 1 : end + 2])
 
     centerline = snap_end_to_end(centerline, input_line)
 
     # Check centerline. If valid, regenerate by splitting polygon into two halves.
-    if not centerline_is_valid(centerline, input_line):
+    if not centerline_is_valid(centerline, input_line, endpoints):
         try:
             print('Regenerating line ...')
             centerline = regenerate_centerline(poly, input_line)
@@ -224,37 +343,64 @@ def find_centerline(poly, input_line):
     return centerline, CenterlineStatus.SUCCESS
 
 
+def _polygonize_mask(mask, in_transform):
+    """
+    Polygonize connected regions of a boolean raster mask.
+
+    Args:
+        mask (np.ndarray): Boolean raster, True cells are polygonized.
+        in_transform (Affine): Raster transform.
+
+    Returns:
+        np.ndarray: Array of polygons, one per connected region.
+
+    """
+    labels, _ = ndimage.label(mask, structure=np.ones((3, 3)))
+    polys = []
+    for k, region in enumerate(ndimage.find_objects(labels), start=1):
+        # pad region so all contours are closed
+        region_mask = np.pad(labels[region] == k, 1)
+        contours = measure.find_contours(region_mask, 0.5, fully_connected="high")
+        rings = []
+        for contour in contours:
+            rows = contour[:, 0] + region[0].start - 1
+            cols = contour[:, 1] + region[1].start - 1
+            xs, ys = rasterio.transform.xy(in_transform, rows, cols)
+            rings.append(sh_geom.LinearRing(np.column_stack([xs, ys])))
+
+        # the largest ring is the exterior, the rest are holes
+        rings.sort(key=lambda ring: sh_geom.Polygon(ring).area, reverse=True)
+        polys.append(sh_geom.Polygon(rings[0], rings[1:]))
+
+    return np.array(polys, dtype=object)
+
+
 def find_corridor_polygon(corridor_thresh, in_transform, line_gpd):
     # Threshold corridor raster used for generating centerline
-    corridor_thresh_cl = np.ma.where(corridor_thresh == 0.0, 1, 0).data
-    if corridor_thresh_cl.dtype == np.int64:
-        corridor_thresh_cl = corridor_thresh_cl.astype(np.int32)
-
-    corridor_mask = np.where(1 == corridor_thresh_cl, True, False)
-    poly_generator = rasterio.features.shapes(
-        corridor_thresh_cl, mask=corridor_mask, transform=in_transform
-    )
+    # masked cells are outside corridor
+    corridor_mask = np.ma.filled(corridor_thresh == 0.0, False)
     corridor_polygon = []
 
     try:
-        for poly, value in poly_generator:
-            if sh_geom.shape(poly).area > 1:
-                corridor_polygon.append(sh_geom.shape(poly))
+        poly_arr = _polygonize_mask(corridor_mask, in_transform)
+        corridor_polygon = list(poly_arr[shapely.area(poly_arr) > 1])
     except Exception as e:
         print(f"find_corridor_polygon: {e}")
 
     if corridor_polygon:
         corridor_polygon = (sh_ops.unary_union(corridor_polygon))
         if type(corridor_polygon) is sh_geom.MultiPolygon:
-            poly_list = shapely.get_parts(corridor_polygon)
-            merge_poly = poly_list[0]
-            for i in range(1, len(poly_list)):
-                if shapely.intersects(merge_poly, poly_list[i]):
-                    merge_poly = shapely.union(merge_poly, poly_list[i])
-                else:
-                    buffer_dist = poly_list[i].distance(merge_poly) + 0.1
-                    buffer_poly = poly_list[i].buffer(buffer_dist)
-                    merge_poly = shapely.union(merge_poly, buffer_poly)
+            poly_arr = shapely.get_parts(corridor_polygon)
+            inter_mask = shapely.intersects(poly_arr[0], poly_arr)
+            merge_poly = shapely.unary_union(poly_arr[inter_mask])
+
+            # buffer the rest of polygons to reach the merged polygon
+            non_inter = poly_arr[~inter_mask]
+            if len(non_inter) > 0:
+                buffer_dist = shapely.distance(merge_poly, non_inter) + 0.1
+                buffer_poly = shapely.buffer(non_inter, buffer_dist, quad_segs=16)
+                merge_poly = shapely.unary_union(np.append(buffer_poly, merge_poly))
+
             corridor_polygon = merge_poly
     else:
         corridor_polygon = None
@@ -266,52 +412,207 @@ def find_corridor_polygon(corridor_thresh, in_transform, line_gpd):
     return corridor_poly_gpd
 
 
-def process_single_centerline(row_and_path):
+def find_centerlines_batched(polys, input_lines):
     """
-    Find centerline.
+    Find centerlines for a batch of polygons and input lines.
+
+    Same as calling find_centerline on each pair, but polygon preparation and
+    Voronoi edge filtering run as vectorized shapely calls on the whole batch.
 
     Args:
-    row_and_path (list of row (gdf and lc_path)): and least cost path
-    first is GeoPandas row, second is input line, (least cost path)
+        polys (array_like): Corridor polygons
+        input_lines (array_like): Least cost paths or seed lines
 
     Returns:
-    row: GeoPandas row with centerline
+        list: (centerline, status) for each polygon and input line pair
+
+    """
+    polys = np.array(polys, dtype=object)
+    results = [(line, CenterlineStatus.FAILED) for line in input_lines]
+
+    # buffer to reduce MultiPolygons
+    multi = shapely.get_type_id(polys) == shapely.GeometryType.MULTIPOLYGON
+    polys[multi] = shapely.buffer(polys[multi], bt_const.SMALL_BUFFER)
+
+    valid = shapely.get_type_id(polys) == shapely.GeometryType.POLYGON
+    valid &= ~shapely.is_empty(polys)
+    for _ in np.flatnonzero(multi & ~valid):
+        print('sh_geom.MultiPolygon encountered, skip.')
+
+    idx = np.flatnonzero(valid)
+    if len(idx) == 0:
+        return results
+
+    # only the boundary needs densifying
+    exteriors = shapely.segmentize(
+        shapely.get_exterior_ring(polys[idx]), CenterlineParams.SEGMENTIZE_LENGTH
+    )
+    if bt_const.CenterlineFlags.DELETE_HOLES:
+        polys = shapely.polygons(exteriors)
+    else:
+        polys = np.array(
+            [sh_geom.Polygon(e, p.interiors) for e, p in zip(exteriors, polys[idx])]
+        )
+    if bt_const.CenterlineFlags.SIMPLIFY_POLYGON:
+        polys = shapely.simplify(polys, CenterlineParams.SIMPLIFY_LENGTH)
+
+    # Voronoi diagrams need per polygon points
+    borders = shapely.segmentize(
+        shapely.get_exterior_ring(polys), CenterlineParams.SEGMENTIZE_LENGTH
+    )
+    edges = [
+        shapely.get_parts(
+            shapely.voronoi_polygons(
+                sh_geom.MultiPoint(shapely.get_coordinates(border)), only_edges=True
+            )
+        )
+        for border in borders
+    ]
+
+    # keep Voronoi edges inside polygon only, in one predicate call
+    counts = [len(i) for i in edges]
+    shapely.prepare(polys)
+    inside = shapely.contains(np.repeat(polys, counts), np.concatenate(edges))
+    inside = np.split(inside, np.cumsum(counts)[:-1])
+
+    for i, poly, poly_edges, edge_inside in zip(idx, polys, edges, inside):
+        try:
+            centerline = None
+            if edge_inside.any():
+                centerline = _edges_to_centerline(
+                    poly_edges[edge_inside], CenterlineParams.SMOOTH_SIGMA
+                )
+            results[i] = _finish_centerline(centerline, poly, input_lines[i])
+        except Exception as e:
+            print(f'find_centerlines_batched: {e}')
+
+    return results
+
 
+def process_single_centerline(poly_and_path):
     """
-    row = row_and_path[0]
-    lc_path = row_and_path[1]
+    Find centerline.
+
+    Args:
+    poly_and_path (tuple): index, corridor polygon and least cost path
+    first is row index, second is polygon, third is input line (least cost path)
 
-    poly = row.geometry.iloc[0]
+    Returns:
+    tuple: row index and centerline
+
+    """
+    idx, poly, lc_path = poly_and_path
     centerline, status = find_centerline(poly, lc_path)
-    row['centerline'] = centerline
 
-    return row
+    return idx, centerline
 
 
-def find_centerlines(poly_gpd, line_seg, processes):
-    centerline_gpd = []
-    rows_and_paths = []
+def process_centerline_batch(batch):
+    """
+    Find centerlines for a batch of polygons.
 
-    try:
-        for i in poly_gpd.index:
-            row = poly_gpd.loc[[i]]
-            if 'OLnSEG' in line_seg.columns:
-                line_id, Seg_id = row['OLnFID'].iloc[0], row['OLnSEG'].iloc[0]
-                lc_path = line_seg.loc[
-                    (line_seg.OLnFID == line_id) & (line_seg.OLnSEG == Seg_id)
-                ]["geometry"].iloc[0]
-            else:
-                line_id = row['OLnFID'].iloc[0]
-                lc_path = line_seg.loc[(line_seg.OLnFID == line_id)]['geometry'].iloc[0]
+    Args:
+    batch (tuple): arrays of row index, corridor polygon WKB and
+    least cost path WKB
 
-            rows_and_paths.append((row, lc_path))
-    except Exception as e:
-        print(f"find_centerlines: {e}")
+    Returns:
+    list: tuples of row index and centerline
 
-    centerline_gpd = bt_base.execute_multiprocessing(
-        process_single_centerline, rows_and_paths, "find_centerlines", processes, 1
+    """
+    idx, poly_wkb, lc_path_wkb = batch
+    results = find_centerlines_batched(
+        shapely.from_wkb(poly_wkb), shapely.from_wkb(lc_path_wkb)
     )
-    return pd.concat(centerline_gpd)
+
+    return [(i, centerline) for i, (centerline, _) in zip(idx, results)]
+
+
+def find_centerlines(poly_gpd, line_seg, processes, batch_size=None):
+    key_cols = ['OLnFID', 'OLnSEG'] if 'OLnSEG' in line_seg.columns else 'OLnFID'
+    line_lookup = line_seg.set_index(key_cols).geometry
+    line_lookup = line_lookup[~line_lookup.index.duplicated()]
+    poly_keys = poly_gpd.set_index(key_cols).index
+
+    lc_paths = np.asarray(line_lookup.reindex(poly_keys), dtype=object)
+    found = ~shapely.is_missing(lc_paths)
+    for key in poly_keys[~found]:
+        print(f"find_centerlines: no line found for {key}")
+
+    # ship plain arrays of WKB to workers
+    idx = poly_gpd.index[found].to_numpy()
+    poly_wkb = shapely.to_wkb(np.asarray(poly_gpd.geometry, dtype=object)[found])
+    lc_path_wkb = shapely.to_wkb(lc_paths[found])
+
+    # spread polygons over all workers, at most 16 polygons per batch
+    if not batch_size:
+        batch_size = max(1, min(16, math.ceil(len(idx) / max(processes, 1))))
+
+    batches = [
+        (
+            idx[i : i + batch_size],
+            poly_wkb[i : i + batch_size],
+            lc_path_wkb[i : i + batch_size],
+        )
+        for i in range(0, len(idx), batch_size)
+    ]
+    result = bt_base.execute_multiprocessing(
+        process_centerline_batch, batches, "find_centerlines", processes, 1
+    )
+    result = [item for batch in result for item in batch]
+
+    idx, centerlines = zip(*result)
+    centerline_gpd = poly_gpd.loc[list(idx)].copy()
+    centerline_gpd['centerline'] = list(centerlines)
+
+    return centerline_gpd
+
+
+def _split_coords_half(coords):
+    """
+    Split line coordinates into two halves of equal length.
+
+    Args:
+        coords (np.ndarray): Line coordinates, one vertex per row.
+
+    Returns:
+        tuple: Coordinates of the first and second half.
+
+    """
+    seg_len = np.hypot(*np.diff(coords[:, :2], axis=0).T)
+    cum_len = np.concatenate([[0.0], np.cumsum(seg_len)])
+    half = cum_len[-1] / 2
+
+    i = np.searchsorted(cum_len, half) - 1
+    ratio = (half - cum_len[i]) / seg_len[i]
+    mid = coords[i] + ratio * (coords[i + 1] - coords[i])
+
+    coords_1 = np.vstack([coords[cum_len < half], mid])
+    coords_2 = np.vstack([mid, coords[cum_len > half]])
+    return coords_1, coords_2
+
+
+def _perp_line(pts, offset=20):
+    """
+    Perpendicular line through the middle of three points.
+
+    The line bisects the angle between the middle point and the two end points,
+    same as algo_common.generate_perpendicular_line_precise.
+
+    Args:
+        pts (np.ndarray): (3, 2) array of head, center and tail points.
+        offset (float): Length of the perpendicular line.
+
+    Returns:
+        np.ndarray: (2, 2) array of perpendicular line end points.
+
+    """
+    center = pts[1]
+    angle_1 = np.arctan2(*(pts[0] - center)[::-1])
+    angle_2 = np.arctan2(*(pts[2] - center)[::-1])
+    angle = (angle_1 + angle_2) / 2.0
+    half_vec = offset / 2.0 * np.array([np.cos(angle), np.sin(angle)])
+
+    return np.array([center + half_vec, center - half_vec])
 
 
 def regenerate_centerline(poly, input_line):
@@ -326,21 +627,13 @@ def regenerate_centerline(poly, input_line):
         sh_geom.MultiLineString
 
     """
-    line_1 = sh_ops.substring(
-        input_line, start_dist=0.0, end_dist=input_line.length / 2
-    )
-    line_2 = sh_ops.substring(
-        input_line, start_dist=input_line.length / 2, end_dist=input_line.length
-    )
+    coords = shapely.get_coordinates(input_line, include_z=input_line.has_z)
+    coords_1, coords_2 = _split_coords_half(coords)
+    line_1 = sh_geom.LineString(coords_1)
+    line_2 = sh_geom.LineString(coords_2)
 
-    pts = shapely.force_2d(
-        [
-            sh_geom.Point(list(input_line.coords)[0]),
-            sh_geom.Point(list(line_1.coords)[-1]),
-            sh_geom.Point(list(input_line.coords)[-1]),
-        ]
-    )
-    perp = algo_common.generate_perpendicular_line_precise(pts)
+    pts = np.array([coords[0, :2], coords_1[-1, :2], coords[-1, :2]])
+    perp = sh_geom.LineString(_perp_line(pts))
 
     # sh_geom.MultiPolygon is rare, but need to be dealt with
     # remove polygon of area less than CenterlineParams.CLEANUP_POLYGON_BY_AREA
@@ -373,10 +666,8 @@ def regenerate_centerline(poly, input_line):
     # find polygon and line pairs
     pair_line_1 = line_1
     pair_line_2 = line_2
-    if not poly_1.intersects(line_1):
-        pair_line_1 = line_2
-        pair_line_2 = line_1
-    elif poly_1.intersection(line_1).length < line_1.length / 3:
+    line_inter = shapely.intersection(poly_1, line_1)
+    if line_inter.is_empty or line_inter.length < line_1.length / 3:
         pair_line_1 = line_2
         pair_line_2 = line_1
 
@@ -398,7 +689,33 @@ def regenerate_centerline(poly, input_line):
         print(f"regenerate_centerline: {e}")
 
     print("Centerline is regenerated.")
-    return sh_ops.linemerge(sh_geom.MultiLineString([center_line_1, center_line_2]))
+    return _join_lines(center_line_1, center_line_2)
+
+
+def _join_lines(line_1, line_2):
+    """
+    Join two lines, concatenate coordinates when one ends where the other starts.
+
+    Args:
+        line_1, line_2 (sh_geom.LineString): lines to join
+
+    Returns:
+        sh_geom.LineString | sh_geom.MultiLineString: merged line
+
+    """
+    if (
+        type(line_1) is sh_geom.LineString
+        and type(line_2) is sh_geom.LineString
+        and line_1.has_z == line_2.has_z
+    ):
+        coords_1 = shapely.get_coordinates(line_1, include_z=line_1.has_z)
+        coords_2 = shapely.get_coordinates(line_2, include_z=line_2.has_z)
+        if np.allclose(coords_1[-1], coords_2[0], rtol=0, atol=bt_const.BT_EPSILON):
+            return sh_geom.LineString(np.vstack([coords_1, coords_2[1:]]))
+        if np.allclose(coords_2[-1], coords_1[0], rtol=0, atol=bt_const.BT_EPSILON):
+            return sh_geom.LineString(np.vstack([coords_2, coords_1[1:]]))
+
+    return sh_ops.linemerge(sh_geom.MultiLineString([line_1, line_2]))
 
 class SeedLine:
     """Class to store seed line and least cost path."""
@@ -407,10 +724,70 @@ class SeedLine:
         self.line = line_gdf
         self.raster = ras_file
         self.line_radius = line_radius
-        self.lc_path = None
-        self.centerline = None
+        self.lc_path_geom = None
+        self.centerline_geom = None
         self.corridor_poly_gpd = None
 
+    def _to_gdf(self, geom):
+        """Wrap geometry in a copy of the seed line GeoDataFrame."""
+        if geom is None:
+            return None
+
+        line_gdf = self.line.copy()
+        line_gdf.geometry = [geom]
+        return line_gdf
+
+    @property
+    def lc_path(self):
+        """Least cost path GeoDataFrame with seed line attributes."""
+        return self._to_gdf(self.lc_path_geom)
+
+    @property
+    def centerline(self):
+        """Centerline GeoDataFrame with seed line attributes."""
+        return self._to_gdf(self.centerline_geom)
+
+    @staticmethod
+    def _crop_cost(cost_clip, out_meta, clip_geom):
+        """
+        Crop cost raster to geometry, cells outside geometry are set to nan.
+
+        Args:
+            cost_clip (np.ndarray): Cost raster.
+            out_meta (dict): Raster meta of cost raster.
+            clip_geom (sh_geom.Polygon): Clip geometry.
+
+        Returns:
+            tuple: Cropped cost raster and its raster meta.
+
+        """
+        height, width = cost_clip.shape
+        min_x, min_y, max_x, max_y = clip_geom.bounds
+        col_0, row_0 = ~out_meta["transform"] * (min_x, max_y)
+        col_1, row_1 = ~out_meta["transform"] * (max_x, min_y)
+        rows = slice(max(int(np.floor(row_0)), 0), min(int(np.ceil(row_1)), height))
+        cols = slice(max(int(np.floor(col_0)), 0), min(int(np.ceil(col_1)), width))
+
+        crop_transform = out_meta["transform"] * rasterio.Affine.translation(
+            cols.start, rows.start
+        )
+        crop_cost = cost_clip[rows, cols].copy()
+        outside = ras_feat.geometry_mask(
+            [clip_geom], crop_cost.shape, crop_transform
+        )
+        crop_cost[outside] = np.nan
+
+        crop_meta = out_meta.copy()
+        crop_meta.update(
+            {
+                "height": crop_cost.shape[0],
+                "width": crop_cost.shape[1],
+                "transform": crop_transform,
+            }
+        )
+
+        return crop_cost, crop_meta
+
     def compute(self):
         line = self.line.geometry[0]
         line_radius = self.line_radius
@@ -436,11 +813,11 @@ class SeedLine:
             return default_return
 
         if lc_path:
-            lc_path_coords = lc_path.coords
+            lc_path_coords = shapely.get_coordinates(lc_path)
         else:
             lc_path_coords = []
 
-        self.lc_path = lc_path
+        self.lc_path_geom = lc_path
 
         # search for centerline
         if len(lc_path_coords) < 2:
@@ -448,12 +825,11 @@ class SeedLine:
             self.line["status"] = CenterlineStatus.FAILED.value
             return default_return
 
-        # get corridor raster
+        # get corridor raster by cropping cost raster around least cost path
         lc_path = sh_geom.LineString(lc_path_coords)
-        ras_clip, out_meta = bt_common.clip_raster(
-            in_raster, lc_path, line_radius * 0.9
+        cost_clip, out_meta = self._crop_cost(
+            cost_clip, out_meta, lc_path.buffer(line_radius * 0.9)
         )
-        cost_clip, _ = algo_cost.cost_raster(ras_clip, out_meta)
 
         out_transform = out_meta["transform"]
         transformer = rasterio.transform.AffineTransformer(out_transform)
@@ -477,15 +853,10 @@ class SeedLine:
         corridor_poly_gpd = find_corridor_polygon(
             corridor_thresh_cl, out_transform, df
         )
-        center_line, status = find_centerline(
-            corridor_poly_gpd.geometry.iloc[0], lc_path
-        )
+        corridor_poly = corridor_poly_gpd.geometry.iloc[0]
+        center_line, status = find_centerline(corridor_poly, lc_path)
         self.line["status"] = status.value
 
-        self.lc_path = self.line.copy()
-        self.lc_path.geometry = [lc_path]
-
-        self.centerline = self.line.copy()
-        self.centerline.geometry = [center_line]
-
+        self.lc_path_geom = lc_path
+        self.centerline_geom = center_line
         self.corridor_poly_gpd = corridor_poly_gpd
\ No newline at end of file
@@ -19,19 +19,33 @@ the Free Software Foundation; either version 2 of the License, or
 # This will get replaced with a git SHA1 when you do a git archive
 __revision__ = '$Format:%H$'
 
+import heapq
 import math
-import queue
 from collections import defaultdict
+from functools import lru_cache
 
 import numpy as np
 import rasterio
 import shapely.geometry as sh_geom
 import skimage.graph as sk_graph
-
-import beratools.core.constants as bt_const
+from numba import njit
 
 sqrt2 = math.sqrt(2)
-USE_NUMPY_FOR_DIJKSTRA = True
+
+# row offset, column offset and distance factor of 8 neighbors
+NEIGHBOR_OFFSETS = (
+    (1, 0, 1.0), (0, -1, 1.0), (-1, 0, 1.0), (0, 1, 1.0),
+    (1, -1, sqrt2), (1, 1, sqrt2), (-1, -1, sqrt2), (-1, 1, sqrt2),
+)
+NEIGHBOR_ROWS = np.array([item[0] for item in NEIGHBOR_OFFSETS])
+NEIGHBOR_COLS = np.array([item[1] for item in NEIGHBOR_OFFSETS])
+NEIGHBOR_FACTORS = np.array([item[2] for item in NEIGHBOR_OFFSETS])
+
+# 4-ary heap is shallower than binary heap and its children share cache lines
+HEAP_ARITY = 4
+
+# number of decided cells between progress updates in dijkstra with feedback
+PROGRESS_INTERVAL = 4096
 
 
 class MinCostPathHelper:
@@ -50,14 +64,10 @@ class MinCostPathHelper:
 
     @staticmethod
     def create_points_from_path(ras_transform, min_cost_path, start_point, end_point):
-        path_points = list(
-            map(
-                lambda row_col: MinCostPathHelper._row_col_to_point(
-                    row_col, ras_transform
-                ),
-                min_cost_path,
-            )
-        )
+        # transform all cell centers at once
+        rows, cols = np.asarray(min_cost_path).T
+        xs, ys = ras_transform.xy(rows, cols)
+        path_points = list(zip(np.ravel(xs).tolist(), np.ravel(ys).tolist()))
         path_points[0] = (start_point.x, start_point.y)
         path_points[-1] = (end_point.x, end_point.y)
         return path_points
@@ -69,50 +79,346 @@ class MinCostPathHelper:
         return sh_geom.LineString(path_points_raw), attr_vals
 
     @staticmethod
-    def block2matrix_numpy(block, nodata):
-        contains_negative = False
-        with np.nditer(block, flags=["refs_ok"], op_flags=['readwrite']) as it:
-            for x in it:
-                # TODO: this speeds up a lot, but need further inspection
-                # if np.isclose(x, nodata) or np.isnan(x):
-                if x <= nodata or np.isnan(x):
-                    x[...] = 9999.0
-                elif x < 0:
-                    contains_negative = True
-
-        return block, contains_negative
+    def block2matrix_numpy(block, nodata, nodata_cost=9999.0):
+        block = block.astype(np.float32)
+        # negative costs are treated as nodata
+        nodata_mask = np.isnan(block) | (block <= nodata) | (block < 0)
+        block[nodata_mask] = nodata_cost
 
-    @staticmethod
-    def block2matrix(block, nodata):
-        contains_negative = False
-        width, height = block.shape
-        # TODO: deal with nodata
-        matrix = [
-            [
-                None
-                if np.isclose(block[i][j], nodata)
-                or np.isclose(block[i][j], bt_const.BT_NODATA)
-                else block[i][j]
-                for j in range(height)
-            ]
-            for i in range(width)
-        ]
+        return block
+
+
+@njit(cache=True)
+def _heap_less(heap_cost, heap_idx, i, j):
+    # same ordering as (cost, node) tuples in heapq
+    if heap_cost[i] != heap_cost[j]:
+        return heap_cost[i] < heap_cost[j]
+    return heap_idx[i] < heap_idx[j]
+
+
+@njit(cache=True)
+def _heap_swap(heap_cost, heap_idx, heap_pos, i, j):
+    heap_cost[i], heap_cost[j] = heap_cost[j], heap_cost[i]
+    heap_idx[i], heap_idx[j] = heap_idx[j], heap_idx[i]
+    heap_pos[heap_idx[i]] = i
+    heap_pos[heap_idx[j]] = j
+
+
+@njit(cache=True)
+def _sift_up(heap_cost, heap_idx, heap_pos, pos):
+    while pos > 0:
+        parent = (pos - 1) // HEAP_ARITY
+        if not _heap_less(heap_cost, heap_idx, pos, parent):
+            break
+        _heap_swap(heap_cost, heap_idx, heap_pos, pos, parent)
+        pos = parent
+
+
+@njit(cache=True)
+def _sift_down(heap_cost, heap_idx, heap_pos, size, pos):
+    while True:
+        first = HEAP_ARITY * pos + 1
+        if first >= size:
+            break
+
+        # smallest of up to HEAP_ARITY children
+        child = first
+        for i in range(first + 1, min(first + HEAP_ARITY, size)):
+            if _heap_less(heap_cost, heap_idx, i, child):
+                child = i
+
+        if not _heap_less(heap_cost, heap_idx, child, pos):
+            break
+        _heap_swap(heap_cost, heap_idx, heap_pos, pos, child)
+        pos = child
+
+
+@njit(cache=True)
+def _octile(row, col, goal_row, goal_col):
+    dr = abs(row - goal_row)
+    dc = abs(col - goal_col)
+    return max(dr, dc) + (sqrt2 - 1.0) * min(dr, dc)
+
+
+@njit(cache=True, nogil=True)
+def _dijkstra_core(cost_map, starts, is_end, n_ends, find_nearest):
+    """
+    Dijkstra search on a cost array with flat cell indices.
+
+    All start cells are pushed with zero cost, so every decided cell is reached
+    from its nearest start, recorded in the returned source array.
+
+    Args:
+        cost_map (np.ndarray): 2D cost array, np.inf for impassable cells,
+            surrounded by a border of np.inf cells
+        starts (np.ndarray): flat indices of start cells
+        is_end (np.ndarray): flat boolean array marking end cells
+        n_ends (int): number of end cells
+        find_nearest (bool): stop at the first end cell reached
+
+    Returns:
+        tuple: parent, cost and source arrays of flat indices,
+            reached end cells in order
+
+    """
+    h, w = cost_map.shape
+    flat_map = cost_map.ravel()
+    cost_so_far = np.full(h * w, np.inf)
+    came_from = np.full(h * w, -1, np.int64)
+    decided = np.zeros(h * w, np.bool_)
+    source_of = np.full(h * w, -1, np.int64)
+    reached = np.empty(n_ends, np.int64)
+    n_reached = 0
+
+    # every cell is in the heap at most once, its cost is decreased in place
+    heap_cost = np.empty(h * w, np.float64)
+    heap_idx = np.empty(h * w, np.int64)
+    heap_pos = np.full(h * w, -1, np.int64)
+    # cost_map has an impassable border, so neighbors never leave the array
+    neighbor_steps = NEIGHBOR_ROWS * w + NEIGHBOR_COLS
+    size = 0
+    for i in range(starts.size):
+        start = starts[i]
+        if heap_pos[start] >= 0:
+            continue
+        heap_cost[size] = 0.0
+        heap_idx[size] = start
+        heap_pos[start] = size
+        _sift_up(heap_cost, heap_idx, heap_pos, size)
+        size += 1
+        cost_so_far[start] = 0.0
+        source_of[start] = i
+
+    while size > 0:
+        current = heap_idx[0]
+        size -= 1
+        _heap_swap(heap_cost, heap_idx, heap_pos, 0, size)
+        _sift_down(heap_cost, heap_idx, heap_pos, size, 0)
+        heap_pos[current] = -1
+        decided[current] = True
+
+        # destination
+        if is_end[current]:
+            reached[n_reached] = current
+            n_reached += 1
+            if n_reached == n_ends or find_nearest:
+                break
+
+        # relax distance
+        curr_v = np.float64(flat_map[current])
+        for k in range(8):
+            nex = current + neighbor_steps[k]
+            offset_v = np.float64(flat_map[nex])
+            if offset_v == np.inf or decided[nex]:
+                continue
+
+            new_cost = (
+                cost_so_far[current] + NEIGHBOR_FACTORS[k] * (curr_v + offset_v) * 0.5
+            )
+
+            if new_cost < cost_so_far[nex]:
+                cost_so_far[nex] = new_cost
+                came_from[nex] = current
+                source_of[nex] = source_of[current]
+                pos = heap_pos[nex]
+                if pos < 0:
+                    pos = size
+                    heap_idx[pos] = nex
+                    heap_pos[nex] = pos
+                    size += 1
+                heap_cost[pos] = new_cost
+                _sift_up(heap_cost, heap_idx, heap_pos, pos)
+
+    return came_from, cost_so_far, source_of, reached[:n_reached]
+
+
+@njit(cache=True, nogil=True)
+def _dijkstra_single(cost_map, start, goal, min_cost):
+    """
+    Search from one start cell to one goal cell, the common least cost path case.
+
+    Specialized _dijkstra_core without end cell bookkeeping and source tracking.
+    The frontier is ordered by cost plus octile distance to goal scaled by
+    min_cost (A*), which is admissible as no step is cheaper. Zero min_cost
+    gives plain dijkstra.
+
+    Args:
+        cost_map (np.ndarray): 2D cost array, np.inf for impassable cells,
+            surrounded by a border of np.inf cells
+        start (int): flat index of start cell
+        goal (int): flat index of goal cell
+        min_cost (float): minimum cell cost used to scale the heuristic
+
+    Returns:
+        tuple: parent and cost arrays of flat indices, whether goal is reached
+
+    """
+    h, w = cost_map.shape
+    flat_map = cost_map.ravel()
+    cost_so_far = np.full(h * w, np.inf)
+    came_from = np.full(h * w, -1, np.int64)
+    decided = np.zeros(h * w, np.bool_)
+
+    heap_cost = np.empty(h * w, np.float64)
+    heap_idx = np.empty(h * w, np.int64)
+    heap_pos = np.full(h * w, -1, np.int64)
+
+    neighbor_steps = NEIGHBOR_ROWS * w + NEIGHBOR_COLS
+    goal_row, goal_col = goal // w, goal % w
+    heap_cost[0] = 0.0
+    heap_idx[0] = start
+    heap_pos[start] = 0
+    size = 1
+    cost_so_far[start] = 0.0
+
+    while size > 0:
+        current = heap_idx[0]
+        size -= 1
+        _heap_swap(heap_cost, heap_idx, heap_pos, 0, size)
+        _sift_down(heap_cost, heap_idx, heap_pos, size, 0)
+        heap_pos[current] = -1
+        decided[current] = True
+
+        if current == goal:
+            return came_from, cost_so_far, True
+
+        # relax distance
+        curr_v = np.float64(flat_map[current])
+        for k in range(8):
+            nex = current + neighbor_steps[k]
+            offset_v = np.float64(flat_map[nex])
+            if offset_v == np.inf or decided[nex]:
+                continue
+
+            new_cost = (
+                cost_so_far[current] + NEIGHBOR_FACTORS[k] * (curr_v + offset_v) * 0.5
+            )
+
+            if new_cost < cost_so_far[nex]:
+                cost_so_far[nex] = new_cost
+                came_from[nex] = current
+                pos = heap_pos[nex]
+                if pos < 0:
+                    pos = size
+                    heap_idx[pos] = nex
+                    heap_pos[nex] = pos
+                    size += 1
+                heap_cost[pos] = new_cost + min_cost * _octile(
+                    nex // w, nex % w, goal_row, goal_col
+                )
+                _sift_up(heap_cost, heap_idx, heap_pos, pos)
+
+    return came_from, cost_so_far, False
+
+
+def _min_passable_cost(cost_map):
+    passable = cost_map[np.isfinite(cost_map)]
+    if passable.size == 0:
+        return 0.0
+
+    return float(passable.min())
+
+
+def _heuristic_goal(cost_map, end_indices, find_nearest):
+    """Return flat goal index and minimum cell cost for A*, goal is -1 if unused."""
+    if not find_nearest or len(end_indices) != 1:
+        return -1, 0.0
+
+    min_cost = _min_passable_cost(cost_map)
+    if min_cost == 0.0:
+        return -1, 0.0
+
+    return end_indices[0], min_cost
+
+
+def _dijkstra_array(grid, start_row_col, end_dict, find_nearest):
+    """
+    Run compiled dijkstra and rebuild paths in the dijkstra result format.
+
+    Dispatches once to the single end kernel or the multiple end kernel.
+    """
+    result = []
+    cost_map = grid.padded_map
+    w = cost_map.shape[1]
+    end_indices = [
+        grid.padded_index(row_col)
+        for row_col in end_dict.keys()
+        if grid._in_bounds(row_col)
+    ]
+
+    start = grid.padded_index(start_row_col)
+    if len(end_indices) == 1:
+        # A* towards the only end cell when the nearest end is wanted
+        _, min_cost = _heuristic_goal(cost_map, end_indices, find_nearest)
+        goal = end_indices[0]
+        came_from, cost_so_far, found = _dijkstra_single(
+            cost_map, start, goal, min_cost
+        )
+        reached = [goal] if found else []
+    else:
+        is_end = np.zeros(cost_map.size, np.bool_)
+        is_end[end_indices] = True
+        came_from, cost_so_far, _, reached = _dijkstra_core(
+            cost_map, np.array([start]), is_end, len(end_dict), find_nearest
+        )
 
-        for row in matrix:
-            for v in row:
-                if v is not None:
-                    if v < 0 and not np.isclose(v, bt_const.BT_NODATA):
-                        contains_negative = True
+    for end_idx in reached:
+        path, costs = _trace_path(came_from, cost_so_far, end_idx, w, start_row_col)
+        end_row, end_col = path[-1]
+        result.append((path, costs, end_dict[(int(end_row), int(end_col))]))
 
-        return matrix, contains_negative
+    return result
+
+
+@njit(cache=True, nogil=True)
+def _trace_nodes(came_from, end_idx):
+    # count path length first, then fill flat indices from the end backwards
+    length = 0
+    traverse_node = end_idx
+    while traverse_node != -1:
+        length += 1
+        traverse_node = came_from[traverse_node]
+
+    nodes = np.empty(length, np.int64)
+    traverse_node = end_idx
+    for i in range(length - 1, -1, -1):
+        nodes[i] = traverse_node
+        traverse_node = came_from[traverse_node]
+
+    return nodes
+
+
+def _trace_path(came_from, cost_so_far, end_idx, w, start_row_col):
+    """
+    Follow parents from end cell back to start.
+
+    Flat indices are of the padded cost map with width w, path cells are
+    returned as rows and columns of the cost map without border.
+
+    Returns:
+        tuple: (n, 2) array of path rows and columns, array of costs
+
+    """
+    nodes = _trace_nodes(came_from, end_idx)
+    rows, cols = np.divmod(nodes, w)
+    path = np.column_stack((rows - 1, cols - 1))
+    costs = cost_so_far[nodes]
+
+    # start point and end point overlaps
+    if len(nodes) == 1:
+        path = np.vstack((start_row_col, path))
+        costs = np.array([0.0, costs[0]])
+
+    return path, costs
 
 
 def dijkstra(start_tuple, end_tuples, block, find_nearest, feedback=None):
     class Grid:
         def __init__(self, matrix):
-            self.map = matrix
-            self.h = len(matrix)
-            self.w = len(matrix[0])
+            self.map = np.asarray(matrix, dtype=np.float32)
+            self.h, self.w = self.map.shape
+            # impassable border, neighbors of any cell stay inside the array
+            self.padded_map = np.pad(self.map, 1, constant_values=np.inf)
             self.manhattan_boundary = None
             self.curr_boundary = None
 
@@ -122,17 +428,14 @@ def dijkstra(start_tuple, end_tuples, block, find_nearest, feedback=None):
 
         def _passable(self, id):
             x, y = id
-            return self.map[x][y] is not None
+            return self.map[x, y] != np.inf
 
         def is_valid(self, id):
             return self._in_bounds(id) and self._passable(id)
 
-        def neighbors(self, id):
+        def padded_index(self, id):
             x, y = id
-            results = [(x + 1, y), (x, y - 1), (x - 1, y), (x, y + 1),
-                       (x + 1, y - 1), (x + 1, y + 1), (x - 1, y - 1), (x - 1, y + 1)]
-            results = list(filter(self.is_valid, results))
-            return results
+            return (x + 1) * (self.w + 2) + y + 1
 
         @staticmethod
         def manhattan_distance(id1, id2):
@@ -159,16 +462,6 @@ def dijkstra(start_tuple, end_tuples, block, find_nearest, feedback=None):
                 for end_node in end_nodes
             }
 
-        def simple_cost(self, cur, nex):
-            cx, cy = cur
-            nx, ny = nex
-            currV = self.map[cx][cy]
-            offsetV = self.map[nx][ny]
-            if cx == nx or cy == ny:
-                return (currV + offsetV) / 2
-            else:
-                return sqrt2 * (currV + offsetV) / 2
-
     result = []
     grid = Grid(block)
 
@@ -179,15 +472,34 @@ def dijkstra(start_tuple, end_tuples, block, find_nearest, feedback=None):
     end_row_col_list = list(end_row_cols)
     start_row_col = start_tuple[0]
 
-    frontier = queue.PriorityQueue()
-    frontier.put((0, start_row_col))
-    came_from = {}
-    cost_so_far = {}
-    decided = set()
-
     if not grid.is_valid(start_row_col):
         return result
 
+    if not feedback:
+        return _dijkstra_array(grid, start_row_col, end_dict, find_nearest)
+
+    # cells are keyed by flat index of the padded cost map
+    w = grid.w + 2
+    n_cells = grid.padded_map.size
+    start = grid.padded_index(start_row_col)
+    end_idx_set = {
+        grid.padded_index(row_col)
+        for row_col in end_row_cols
+        if grid._in_bounds(row_col)
+    }
+    goal, min_cost = _heuristic_goal(
+        grid.padded_map, list(end_idx_set), find_nearest
+    )
+    goal_row, goal_col = divmod(goal, w)
+    frontier = [(0.0, start)]
+    came_from = np.full(n_cells, -1, np.int64)
+    cost_so_far = np.full(n_cells, np.inf)
+    decided = np.zeros(n_cells, np.bool_)
+
+    # plain python floats, indexing a list is much faster than numpy scalars
+    cell_values = grid.padded_map.ravel().tolist()
+    neighbor_steps = [(dr * w + dc, factor) for dr, dc, factor in NEIGHBOR_OFFSETS]
+
     # init progress
     index = 0
     distance_dic = grid.all_manhattan(start_row_col, end_row_cols)
@@ -201,17 +513,20 @@ def dijkstra(start_tuple, end_tuples, block, find_nearest, feedback=None):
     if feedback:
         feedback.setProgress(1 + 100 * (1 - bound / total_manhattan))
 
-    came_from[start_row_col] = None
-    cost_so_far[start_row_col] = 0
+    cost_so_far[start] = 0.0
+    pop_count = 0
 
-    while not frontier.empty():
-        _, current_node = frontier.get()
-        if current_node in decided:
+    while frontier:
+        _, current = heapq.heappop(frontier)
+        if decided[current]:
             continue
-        decided.add(current_node)
+        decided[current] = True
+        cx, cy = divmod(current, w)
+        current_node = (cx - 1, cy - 1)
 
-        # update the progress bar
-        if feedback:
+        # update the progress bar every PROGRESS_INTERVAL cells
+        pop_count += 1
+        if feedback and pop_count % PROGRESS_INTERVAL == 0:
             if feedback.isCanceled():
                 return None
 
@@ -237,35 +552,38 @@ def dijkstra(start_tuple, end_tuples, block, find_nearest, feedback=None):
                         )
 
         # destination
-        if current_node in end_row_cols:
-            path = []
-            costs = []
-            traverse_node = current_node
-            while traverse_node is not None:
-                path.append(traverse_node)
-                costs.append(cost_so_far[traverse_node])
-                traverse_node = came_from[traverse_node]
-
-            # start point and end point overlaps
-            if len(path) == 1:
-                path.append(start_row_col)
-                costs.append(0.0)
-            path.reverse()
-            costs.reverse()
+        if current in end_idx_set:
+            path, costs = _trace_path(
+                came_from, cost_so_far, current, w, start_row_col
+            )
             result.append((path, costs, end_dict[current_node]))
 
-            end_row_cols.remove(current_node)
+            end_idx_set.remove(current)
             end_row_col_list.remove(current_node)
-            if len(end_row_cols) == 0 or find_nearest:
+            if len(end_idx_set) == 0 or find_nearest:
                 break
 
         # relax distance
-        for nex in grid.neighbors(current_node):
-            new_cost = cost_so_far[current_node] + grid.simple_cost(current_node, nex)
-            if nex not in cost_so_far or new_cost < cost_so_far[nex]:
+        current_cost = cost_so_far[current]
+        curr_v = cell_values[current]
+        for step, diag_factor in neighbor_steps:
+            nex = current + step
+            offset_v = cell_values[nex]
+            if offset_v == np.inf or decided[nex]:
+                continue
+
+            new_cost = current_cost + diag_factor * (curr_v + offset_v) * 0.5
+            if new_cost < cost_so_far[nex]:
                 cost_so_far[nex] = new_cost
-                frontier.put((new_cost, nex))
-                came_from[nex] = current_node
+                priority = new_cost
+                if goal >= 0:
+                    nx, ny = divmod(nex, w)
+                    d_row, d_col = abs(nx - goal_row), abs(ny - goal_col)
+                    priority += min_cost * (
+                        max(d_row, d_col) + (sqrt2 - 1.0) * min(d_row, d_col)
+                    )
+                heapq.heappush(frontier, (priority, nex))
+                came_from[nex] = current
 
     return result
 
@@ -299,41 +617,33 @@ def backtrack(initial_node, desired_node, distances):
     # idea start at the last node then choose the least number of steps to go back
     # last node
     path = [desired_node]
+    visited = {desired_node}
 
     size_of_grid = distances.shape[0]
+    directions = (up, down, left, right)
 
     while True:
-        # check up down left right - choose the direction that has the least distance
-        potential_distances = []
-        potential_nodes = []
-
-        directions = [up, down, left, right]
-
+        # check up down left right - choose the unvisited node with least distance
+        best_node = None
+        best_distance = None
         for direction in directions:
             node = direction(path[-1])
-            if valid_node(node, size_of_grid):
-                potential_nodes.append(node)
-                potential_distances.append(distances[node[0], node[1]])
-
-        print(potential_nodes)
-
-        least_distance_index = np.argsort(potential_distances)
-
-        pt_added = False
-        for index in least_distance_index:
-            p_point = potential_nodes[index]
-            if p_point == (1, 6):
-                pass
-            if p_point not in path:
-                path.append(p_point)
-                pt_added = True
-                break
+            if not valid_node(node, size_of_grid) or node in visited:
+                continue
 
-        if index >= len(potential_distances) - 1 and not pt_added:
+            distance = distances[node[0], node[1]]
+            if best_node is None or distance < best_distance:
+                best_node = node
+                best_distance = distance
+
+        if best_node is None:
             print("No best path found.")
             return
 
-        if path[-1][0] == initial_node[0] and path[-1][1] == initial_node[1]:
+        path.append(best_node)
+        visited.add(best_node)
+
+        if best_node[0] == initial_node[0] and best_node[1] == initial_node[1]:
             break
 
     return list(reversed(path))
@@ -362,8 +672,11 @@ def dijkstra_np(start_tuple, end_tuple, matrix):
         matrix[start_node[0], start_node[1]] = 0
         matrix[end_node[0], end_node[1]] = 0
 
-        path, cost = sk_graph.route_through_array(matrix, start_node, end_node)
-        costs = [0.0 for i in range(len(path))]
+        # same search as route_through_array, keeping the accumulated costs
+        mcp = sk_graph.MCP_Geometric(matrix, fully_connected=True)
+        cum_costs, _ = mcp.find_costs([start_node], [end_node])
+        path = mcp.traceback(end_node)
+        costs = [float(cum_costs[row, col]) for row, col in path]
     except Exception as e:
         print(f"dijkstra_np: {e}")
         return None
@@ -371,33 +684,41 @@ def dijkstra_np(start_tuple, end_tuple, matrix):
     return [(path, costs, end_tuple)]
 
 
+@lru_cache(maxsize=8)
+def _cached_transformer(transform_coeffs):
+    return rasterio.transform.AffineTransformer(rasterio.Affine(*transform_coeffs))
+
+
+def affine_transformer(transform):
+    """Return AffineTransformer of raster transform, reused for equal transforms."""
+    return _cached_transformer(tuple(transform)[:6])
+
+
+def _cost_matrix(out_image, in_meta):
+    """Cost matrix of cost raster, nodata cells cost 9999 and stay passable."""
+    if len(out_image.shape) > 2:
+        out_image = np.squeeze(out_image, axis=0)
+
+    matrix = MinCostPathHelper.block2matrix_numpy(out_image, in_meta['nodata'])
+    transformer = affine_transformer(in_meta['transform'])
+
+    return matrix, transformer
+
+
+def _clamp_cell(row_col, shape):
+    """Regulate cell in case it is out of index of matrix."""
+    return tuple(min(max(int(v), 0), size - 1) for v, size in zip(row_col, shape))
+
+
 def find_least_cost_path(
     out_image, in_meta, line, find_nearest=True, output_linear_reference=False
 ):
     default_return = None
-    ras_nodata = in_meta['nodata']
 
     pt_start = line.coords[0]
     pt_end = line.coords[-1]
 
-    out_image = np.where(out_image < 0, np.nan, out_image)  # set negative value to nan
-    if len(out_image.shape) > 2:
-        out_image = np.squeeze(out_image, axis=0)
-
-    if USE_NUMPY_FOR_DIJKSTRA:
-        matrix, contains_negative = MinCostPathHelper.block2matrix_numpy(
-            out_image, ras_nodata
-        )
-    else:
-        matrix, contains_negative = MinCostPathHelper.block2matrix(
-            out_image, ras_nodata
-        )
-
-    if contains_negative:
-        print('ERROR: Raster has negative values.')
-        return default_return
-
-    transformer = rasterio.transform.AffineTransformer(in_meta['transform'])
+    matrix, transformer = _cost_matrix(out_image, in_meta)
 
     if (type(pt_start[0]) is tuple or
             type(pt_start[1]) is tuple or
@@ -428,19 +749,17 @@ def find_least_cost_path(
         end_tuple = end_tuples[0]
 
         # regulate end point coords in case they are out of index of matrix
-        mat_size = matrix.shape
-        mat_size = (mat_size[0] - 1, mat_size[0] - 1)
-        start_tuple = (min(start_tuple[0], mat_size), start_tuple[1], start_tuple[2])
-        end_tuple = (min(end_tuple[0], mat_size), end_tuple[1], end_tuple[2])
+        start_tuple = (
+            _clamp_cell(start_tuple[0], matrix.shape), start_tuple[1], start_tuple[2]
+        )
+        end_tuple = (
+            _clamp_cell(end_tuple[0], matrix.shape), end_tuple[1], end_tuple[2]
+        )
 
     except Exception as e:
         print(f"find_least_cost_path: {e}")
 
-    if USE_NUMPY_FOR_DIJKSTRA:
-        result = dijkstra_np(start_tuple, end_tuple, matrix)
-    else:
-        # TODO: change end_tuples to end_tuple
-        result = dijkstra(start_tuple, end_tuples, matrix, find_nearest)
+    result = dijkstra_np(start_tuple, end_tuple, matrix)
 
     if result is None:
         return default_return
@@ -468,13 +787,141 @@ def find_least_cost_path(
     return lc_path
 
 
+def _prepare_lines(out_image, in_meta, lines):
+    """
+    Build padded cost matrix and cells of lines for the compiled dijkstra.
+
+    Cost matrix and end cells are the same as in find_least_cost_path.
+
+    Returns:
+        tuple: padded cost matrix, transformer and list of line items
+            (index, start cell, start index, end index, start point, end point)
+
+    """
+    matrix, transformer = _cost_matrix(out_image, in_meta)
+    w = matrix.shape[1]
+
+    # impassable border, flat indices are of the padded matrix
+    padded = np.pad(matrix, 1, constant_values=np.inf)
+
+    items = []
+    for i, line in enumerate(lines):
+        pt_start = sh_geom.Point(line.coords[0][:2])
+        pt_end = sh_geom.Point(line.coords[-1][:2])
+        start = _clamp_cell(transformer.rowcol(pt_start.x, pt_start.y), matrix.shape)
+        end = _clamp_cell(transformer.rowcol(pt_end.x, pt_end.y), matrix.shape)
+        start_idx = (start[0] + 1) * (w + 2) + start[1] + 1
+        end_idx = (end[0] + 1) * (w + 2) + end[1] + 1
+        items.append((i, start, start_idx, end_idx, pt_start, pt_end))
+
+    return padded, transformer, items
+
+
+def _free_cells(padded, cells):
+    """Copy of padded cost matrix with cells of zero cost, as dijkstra_np does."""
+    cost_map = padded.copy()
+    cost_map.ravel()[cells] = 0.0
+    return cost_map
+
+
+def _path_to_line(transformer, nodes, w, pt_start, pt_end):
+    """LineString of path of flat indices, None if start and end cells overlap."""
+    rows, cols = np.divmod(nodes, w)
+    path = np.column_stack((rows - 1, cols - 1))
+    path_points = MinCostPathHelper.create_points_from_path(
+        transformer, path, pt_start, pt_end
+    )
+    if len(path_points) < 2:
+        return None
+
+    return sh_geom.LineString(path_points)
+
+
+def _single_line_path(padded, transformer, item, min_cost):
+    """Search one line with the single end kernel, return LineString or None."""
+    _, _, start_idx, end_idx, pt_start, pt_end = item
+    cost_map = _free_cells(padded, [start_idx, end_idx])
+
+    # step into the free end cell costs at least half of min_cost,
+    # so the heuristic is scaled by half to stay admissible
+    came_from, _, found = _dijkstra_single(
+        cost_map, start_idx, end_idx, min_cost * 0.5
+    )
+    if not found:
+        return None
+
+    nodes = _trace_nodes(came_from, end_idx)
+    return _path_to_line(transformer, nodes, padded.shape[1], pt_start, pt_end)
+
+
+def find_least_cost_paths_batch(out_image, in_meta, lines):
+    """
+    Find least cost paths of many lines on one cost raster with a shared search.
+
+    One multi-source dijkstra sweep from all start points settles every end
+    point from its nearest start, with start and end cells of all lines free.
+    Lines whose end point is settled from their own start by a path through
+    no free cell of other lines take the shared path, which is then also the
+    least cost path of find_least_cost_path. The others fall back to a single
+    search.
+
+    Args:
+        out_image (np.ndarray): cost raster
+        in_meta (dict): raster metadata with nodata and transform
+        lines (list): LineStrings from start point to end point
+
+    Returns:
+        list: least cost path LineString or None for each line
+
+    """
+    padded, transformer, items = _prepare_lines(out_image, in_meta, lines)
+    lc_paths = [None] * len(lines)
+    if not items:
+        return lc_paths
+
+    starts = np.array([item[2] for item in items])
+    ends = np.array([item[3] for item in items])
+    is_end = np.zeros(padded.size, np.bool_)
+    is_end[ends] = True
+    is_free = np.zeros(padded.size, np.bool_)
+    is_free[starts] = True
+    is_free[ends] = True
+
+    came_from, _, source_of, _ = _dijkstra_core(
+        _free_cells(padded, np.flatnonzero(is_free)),
+        starts,
+        is_end,
+        int(is_end.sum()),
+        False,
+    )
+
+    w = padded.shape[1]
+    min_cost = _min_passable_cost(padded)
+    for item in items:
+        i, _, start_idx, end_idx, pt_start, pt_end = item
+        if source_of[end_idx] >= 0 and starts[source_of[end_idx]] == start_idx:
+            nodes = _trace_nodes(came_from, end_idx)
+            inner = nodes[(nodes != start_idx) & (nodes != end_idx)]
+            if not is_free[inner].any():
+                lc_paths[i] = _path_to_line(
+                    transformer, nodes, w, pt_start, pt_end
+                )
+                continue
+
+        # end point is closer to another start or the shared path
+        # crosses free cells of other lines, search this line alone
+        lc_paths[i] = _single_line_path(padded, transformer, item, min_cost)
+
+    return lc_paths
+
+
 def find_least_cost_path_skimage(cost_clip, in_meta, seed_line):
     lc_path_new = []
     if len(cost_clip.shape) > 2:
         cost_clip = np.squeeze(cost_clip, axis=0)
 
     out_transform = in_meta['transform']
-    transformer = rasterio.transform.AffineTransformer(out_transform)
+    transformer = affine_transformer(out_transform)
 
     x1, y1 = list(seed_line.coords)[0][:2]
     x2, y2 = list(seed_line.coords)[-1][:2]
@@ -13,18 +13,21 @@ Description:
     The purpose of this script is to provide main interface for canopy footprint tool.
     The tool is used to generate the footprint of a line based on relative threshold.
 """
-import math
+import os
+import threading
 import time
 from enum import StrEnum
 
 import geopandas as gpd
 import numpy as np
-import pandas as pd
+import rasterio
 import rasterio.features as ras_feat
 import shapely
 import shapely.geometry as sh_geom
 import shapely.ops as sh_ops
-from skimage.graph import MCP_Flexible
+from numba import njit
+from scipy import sparse
+from scipy.sparse import csgraph
 
 import beratools.core.algo_common as algo_common
 import beratools.core.algo_cost as algo_cost
@@ -32,6 +35,140 @@ import beratools.core.constants as bt_const
 import beratools.core.tool_base as bt_base
 import beratools.tools.common as bt_common
 
+# opened CHM datasets, one per worker process or thread and raster path
+_CHM_CACHE = {}
+
+
+def _open_chm(in_chm):
+    """Open CHM once per worker and keep it open for all clips of the lines."""
+    # datasets are not shared between threads
+    key = (os.getpid(), threading.get_ident(), in_chm)
+    if key not in _CHM_CACHE:
+        _CHM_CACHE[key] = rasterio.open(in_chm)
+
+    return _CHM_CACHE[key]
+
+
+def _close_chm():
+    """Close CHM datasets opened in this process and clear the cache."""
+    while _CHM_CACHE:
+        _, chm = _CHM_CACHE.popitem()
+        chm.close()
+
+
+def _accumulated_cost(cost, starts):
+    """
+    Accumulated cost from start cells over the 8-connected cost grid.
+
+    Same costs as MCP_Flexible.find_costs: a move costs the value of the cell
+    entered and start cells count their own cost. Cells with infinite or
+    negative cost are impassable.
+
+    Args:
+        cost (np.ndarray): 2D cost array
+        starts (np.ndarray): (n, 2) array of start cells
+
+    Returns:
+        np.ndarray: accumulated cost, inf for unreachable cells
+
+    """
+    rows, cols = cost.shape
+    index = np.arange(cost.size).reshape(cost.shape)
+    passable = np.isfinite(cost) & (cost >= 0)
+
+    # edges in both directions between passable neighbours
+    src, dst = [], []
+    for dr, dc in ((0, 1), (1, -1), (1, 0), (1, 1)):
+        from_cells = (
+            slice(0, rows - dr),
+            slice(max(0, -dc), cols - max(0, dc)),
+        )
+        to_cells = (
+            slice(dr, rows),
+            slice(max(0, dc), cols - max(0, -dc)),
+        )
+        ok = passable[from_cells] & passable[to_cells]
+        src += [index[from_cells][ok], index[to_cells][ok]]
+        dst += [index[to_cells][ok], index[from_cells][ok]]
+
+    # virtual source node linked to all passable start cells
+    starts = np.ravel_multi_index(tuple(np.asarray(starts).T), cost.shape)
+    starts = np.unique(starts[passable.flat[starts]])
+    src.append(np.full(starts.size, cost.size))
+    dst.append(starts)
+
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+    graph = sparse.csr_matrix(
+        (cost.flat[dst], (src, dst)), shape=(cost.size + 1, cost.size + 1)
+    )
+    dist = csgraph.dijkstra(graph, indices=cost.size)
+
+    return dist[:-1].reshape(cost.shape)
+
+
+def _group_by_label(values, labels, valid, n_labels):
+    """
+    Group valid values by labels 1 to n_labels.
+
+    Returns:
+        list: array of values of each label, empty if no valid cell
+
+    """
+    mask = valid & (labels > 0)
+    cell_labels = labels[mask]
+    order = np.argsort(cell_labels, kind="stable")
+    splits = np.searchsorted(cell_labels[order], np.arange(1, n_labels + 2))
+    return np.split(values[mask][order], splits[1:-1])
+
+
+@njit(cache=True)
+def _scan_rate_of_change(per_arr, scale_down):
+    """
+    Scan ring percentiles for the first steep rate of change.
+
+    The rate of change is tested from > 150% (1.5) down to 110% (1.1).
+
+    Returns:
+        tuple: cut distance and cut percentile, both nan if nothing is found.
+
+    """
+    # Since the x interval is 1 unit, the array 'diff' is the rate of change (slope)
+    change = np.zeros(per_arr.size)
+    change[1:] = np.diff(per_arr)
+
+    floor_arr = np.floor(per_arr)
+
+    changes = 1.50
+    while changes >= 1.1:
+        for ii in range(0, change.size - 1):
+            if per_arr[ii] >= 0.5 and change[ii] >= changes:
+                cut_dist = (ii + 1) * scale_down
+                cut_percentile = floor_arr[ii]
+
+                if 0.5 >= cut_percentile:
+                    if cut_dist > 5:
+                        cut_percentile = 2.0
+                        cut_dist = cut_dist * scale_down**3
+                elif 0.5 < cut_percentile <= 5.0:
+                    if cut_dist > 6:
+                        cut_dist = cut_dist * scale_down**3  # 4.0
+                elif 5.0 < cut_percentile <= 10.0:
+                    if cut_dist > 8:  # 5
+                        cut_dist = cut_dist * scale_down**3
+                elif 10.0 < cut_percentile <= 15:
+                    if cut_dist > 5:
+                        cut_dist = cut_dist * scale_down**3  # 5.5
+                elif 15 < cut_percentile:
+                    if cut_dist > 4:
+                        cut_dist = cut_dist * scale_down**2
+                        cut_percentile = 15.5
+
+                return cut_dist, cut_percentile
+        changes = changes - 0.1
+
+    return np.nan, np.nan
+
 
 class Side(StrEnum):
     """Constants for left and right side."""
@@ -44,27 +181,45 @@ class FootprintCanopy:
 
     def __init__(self, in_geom, in_chm, in_layer=None):
         data = gpd.read_file(in_geom, layer=in_layer)
+        self.crs = data.crs
         self.lines = []
 
-        for idx in data.index:
-            line = LineInfo(data.iloc[[idx]], in_chm)
+        # all lines clip the same CHM, read its cell size once
+        with rasterio.open(in_chm) as chm:
+            cell_size = chm.res[0]
+
+        # plain geometries and attribute dicts, no per line GeoDataFrame
+        attrs = data.drop(columns=data.geometry.name).to_dict("records")
+        for geom, line_attrs in zip(data.geometry.values, attrs):
+            line = LineInfo(geom, data.crs, in_chm, line_attrs, cell_size=cell_size)
             self.lines.append(line)
 
     def compute(self, processes, parallel_mode=bt_const.PARALLEL_MODE):
-        result = bt_base.execute_multiprocessing(
-            algo_common.process_single_item,
-            self.lines,
-            "Canopy Footprint",
-            processes,
-            1,
-            parallel_mode,
-        )
+        # worker processes release their datasets on exit, sequential and
+        # threading modes open them in this process
+        try:
+            result = bt_base.execute_multiprocessing(
+                algo_common.process_single_item,
+                self.lines,
+                "Canopy Footprint",
+                processes,
+                1,
+                parallel_mode,
+            )
+        finally:
+            _close_chm()
 
-        fp = [item.footprint for item in result]
-        self.footprints = pd.concat(fp)
+        self.footprints = gpd.GeoDataFrame(
+            [item.footprint_attrs for item in result],
+            geometry=[item.footprint for item in result],
+            crs=self.crs,
+        )
 
-        percentile = [item.line for item in result]
-        self.lines_percentile = pd.concat(percentile)
+        self.lines_percentile = gpd.GeoDataFrame(
+            [item.line_attrs for item in result],
+            geometry=[item.line for item in result],
+            crs=self.crs,
+        )
 
     def save_footprint(self, out_footprint, layer=None):
         self.footprints.to_file(out_footprint, layer=layer)
@@ -85,18 +240,21 @@ class LineInfo:
     """Class to store line information."""
 
     def __init__(self, 
-                 line_gdf, in_chm, 
+                 line, crs, in_chm,
+                 line_attrs=None,
                  max_ln_width=32,
                  tree_radius=1.5,
                  max_line_dist=1.5,
                  canopy_avoidance=0.0,
                  exponent=1.0,
-                 canopy_thresh_percentage=50):
-        self.line = line_gdf
+                 canopy_thresh_percentage=50,
+                 cell_size=None):
+        self.line = line
+        self.crs = crs
+        self.cell_size = cell_size
+        self.line_attrs = dict(line_attrs) if line_attrs else {}
         self.in_chm = in_chm
-        self.line_simp = self.line.geometry.simplify(
-            tolerance=0.5, preserve_topology=True
-        )
+        self.line_simp = self.line.simplify(tolerance=0.5, preserve_topology=True)
 
         self.canopy_percentile = 50
         self.DynCanTh = np.nan
@@ -104,7 +262,8 @@ class LineInfo:
         # if proc_segments:
         # line_seg = split_into_segments(line_seg)
 
-        self.buffer_rings = []
+        self.buffer_rings_left = []
+        self.buffer_rings_right = []
 
         self.CL_CutHt = np.nan
         self.CR_CutHt = np.nan
@@ -112,6 +271,7 @@ class LineInfo:
         self.LDist_Cut = np.nan
 
         self.canopy_thresh_percentage = canopy_thresh_percentage
+        self.canopy_thresh_frac = canopy_thresh_percentage / 100
         self.canopy_avoidance = canopy_avoidance
         self.exponent = exponent
         self.max_ln_width = max_ln_width
@@ -126,45 +286,38 @@ class LineInfo:
         self.buffer_left = None
         self.buffer_right = None
         self.footprint = None
+        self.footprint_attrs = {}
 
     def compute(self):
         self.prepare_ring_buffer()
-
-        ring_list = []
-        for item in self.buffer_rings:
-            ring = self.cal_percentileRing(item)
-            ring_list.append(ring)
-
-        self.buffer_rings = ring_list
+        self.cal_percentile_rings()
 
         self.rate_of_change(self.get_percentile_array(Side.left), Side.left)
         self.rate_of_change(self.get_percentile_array(Side.right), Side.right)
 
-        self.line["CL_CutHt"] = self.CL_CutHt
-        self.line["CR_CutHt"] = self.CR_CutHt
-        self.line["RDist_Cut"] = self.RDist_Cut
-        self.line["LDist_Cut"] = self.LDist_Cut
+        self.line_attrs["CL_CutHt"] = self.CL_CutHt
+        self.line_attrs["CR_CutHt"] = self.CR_CutHt
+        self.line_attrs["RDist_Cut"] = self.RDist_Cut
+        self.line_attrs["LDist_Cut"] = self.LDist_Cut
 
         self.DynCanTh = (self.CL_CutHt + self.CR_CutHt) / 2
-        self.line["DynCanTh"] = self.DynCanTh
+        self.line_attrs["DynCanTh"] = self.DynCanTh
 
         self.prepare_line_buffer()
 
-        fp_left = self.process_single_footprint(Side.left)
-        fp_right = self.process_single_footprint(Side.right)
-        fp_left.geometry = fp_left.buffer(0.005)
-        fp_right.geometry = fp_right.buffer(0.005)
-        self.footprint = pd.concat([fp_left, fp_right])
-        self.footprint = self.footprint.dissolve()
-        self.footprint.geometry = self.footprint.buffer(-0.005)
+        fp_left, corridor_th_left = self.process_single_footprint(Side.left)
+        fp_right, _ = self.process_single_footprint(Side.right)
+        self.footprint = shapely.unary_union([fp_left, fp_right])
+        self.footprint_attrs = {"CorriThresh": corridor_th_left}
 
     def prepare_ring_buffer(self):
         nrings = 1
         ringdist = 15
         ring_list = self.multi_ring_buffer(self.line_simp, nrings, ringdist)
         for i in ring_list:
-            if BufferRing(i, Side.left):
-                self.buffer_rings.append(BufferRing(i, Side.left))
+            ring = BufferRing(i, Side.left)
+            if ring.geometry is not None and not ring.geometry.is_empty:
+                self.buffer_rings_left.append(ring)
             else:
                 print("Empty buffer ring")
 
@@ -172,116 +325,95 @@ class LineInfo:
         ringdist = -15
         ring_list = self.multi_ring_buffer(self.line_simp, nrings, ringdist)
         for i in ring_list:
-            if BufferRing(i, Side.right):
-                self.buffer_rings.append(BufferRing(i, Side.right))
+            ring = BufferRing(i, Side.right)
+            if ring.geometry is not None and not ring.geometry.is_empty:
+                self.buffer_rings_right.append(ring)
             else:
                 print("Empty buffer ring")
 
-    def cal_percentileRing(self, ring):
-        try:
-            line_buffer = ring.geometry
-            if line_buffer.is_empty or shapely.is_missing(line_buffer):
-                return None
-            if line_buffer.has_z:
-                line_buffer = sh_ops.transform(
-                    lambda x, y, z=None: (x, y), line_buffer
-                )
-
-        except Exception as e:
-            print(f"cal_percentileRing: {e}")
+    def cal_percentile_rings(self):
+        """Calculate CHM percentile of all buffer rings from one raster read."""
+        buffer_rings = self.buffer_rings_left + self.buffer_rings_right
+        if not buffer_rings:
+            return
 
         # TODO: temporary workaround for exception causing not percentile defined
         try:
-            clipped_raster, _ = bt_common.clip_raster(self.in_chm, line_buffer, 0)
-            clipped_raster = np.squeeze(clipped_raster, axis=0)
+            geoms = shapely.force_2d([ring.geometry for ring in buffer_rings])
+            chm = _open_chm(self.in_chm)
+            window = ras_feat.geometry_window(chm, geoms)
+            chm_values = chm.read(1, window=window)
+
+            # drop nodata and nan cells
+            valid = (chm_values != bt_const.BT_NODATA) & ~np.isnan(chm_values)
+            if chm.nodata is not None:
+                valid &= chm_values != chm.nodata
+
+            # rings of one side do not overlap, but left and right rings can,
+            # so each side has its own label image and shares overlapped cells
+            ring_values = []
+            n_left = len(self.buffer_rings_left)
+            for side_geoms in (geoms[:n_left], geoms[n_left:]):
+                if len(side_geoms) == 0:
+                    continue
+
+                # cell centers decide as in clip_raster
+                labels = ras_feat.rasterize(
+                    [(geom, i + 1) for i, geom in enumerate(side_geoms)],
+                    out_shape=chm_values.shape,
+                    transform=chm.window_transform(window),
+                    fill=0,
+                    dtype=np.int32,
+                )
+                ring_values.extend(
+                    _group_by_label(chm_values, labels, valid, len(side_geoms))
+                )
 
-            # mask all -9999 (nodata) value cells
-            masked_raster = np.ma.masked_where(
-                clipped_raster == bt_const.BT_NODATA, clipped_raster
-            )
-            filled_raster = np.ma.filled(masked_raster, np.nan)
+            in_raster = shapely.intersects(geoms, sh_geom.box(*chm.bounds))
+        except Exception as e:
+            print(e)
+            print("Default values are used.")
+            return
 
-            # Calculate the percentile
-            percentile = np.nanpercentile(filled_raster, 50)
+        for i, ring in enumerate(buffer_rings):
+            # ring outside of raster keeps default values
+            if not in_raster[i]:
+                continue
 
+            values = ring_values[i]
+            percentile = np.percentile(values, 50) if values.size > 0 else np.nan
             if percentile > 1:
                 ring.Dyn_Canopy_Threshold = percentile * (0.3)
             else:
                 ring.Dyn_Canopy_Threshold = 1
 
             ring.percentile = percentile
-        except Exception as e:
-            print(e)
-            print("Default values are used.")
-
-        return ring
 
     def get_percentile_array(self, side):
-        per_array = []
-        for item in self.buffer_rings:
-            try:
-                if item.side == side:
-                    per_array.append(item.percentile)
-            except Exception as e:
-                print(e)
-
-        return per_array
+        rings = self.buffer_rings_left if side == Side.left else self.buffer_rings_right
+        return np.fromiter((ring.percentile for ring in rings), dtype=np.float64)
 
     def rate_of_change(self, percentile_array, side):
-        # Since the x interval is 1 unit, the array 'diff' is the rate of change (slope)
-        diff = np.ediff1d(percentile_array)
         cut_dist = len(percentile_array) / 5
 
         median_percentile = np.nanmedian(percentile_array)
+        floor_median = float(np.floor(median_percentile))
         if not np.isnan(median_percentile):
-            cut_percentile = float(math.floor(median_percentile))
+            cut_percentile = floor_median
         else:
             cut_percentile = 0.5
 
-        found = False
-        changes = 1.50
-        Change = np.insert(diff, 0, 0)
         scale_down = 1.0
 
-        # test the rate of change is > than 150% (1.5), if it is
-        # no result found then lower to 140% (1.4) until 110% (1.1)
-        try:
-            while not found and changes >= 1.1:
-                for ii in range(0, len(Change) - 1):
-                    if percentile_array[ii] >= 0.5:
-                        if (Change[ii]) >= changes:
-                            cut_dist = (ii + 1) * scale_down
-                            cut_percentile = math.floor(percentile_array[ii])
-
-                            if 0.5 >= cut_percentile:
-                                if cut_dist > 5:
-                                    cut_percentile = 2
-                                    cut_dist = cut_dist * scale_down**3
-                                    # @<0.5  found and modified
-                            elif 0.5 < cut_percentile <= 5.0:
-                                if cut_dist > 6:
-                                    cut_dist = cut_dist * scale_down**3  # 4.0
-                                    # @0.5-5.0  found and modified
-                            elif 5.0 < cut_percentile <= 10.0:
-                                if cut_dist > 8:  # 5
-                                    cut_dist = cut_dist * scale_down**3
-                                    # @5-10  found and modified
-                            elif 10.0 < cut_percentile <= 15:
-                                if cut_dist > 5:
-                                    cut_dist = cut_dist * scale_down**3  # 5.5
-                                    #  @10-15  found and modified
-                            elif 15 < cut_percentile:
-                                if cut_dist > 4:
-                                    cut_dist = cut_dist * scale_down**2
-                                    cut_percentile = 15.5
-                                    #  @>15  found and modified
-                            found = True
-                            # rate of change found
-                            break
-                changes = changes - 0.1
-
-        except IndexError:
-            pass
+        found = False
+        if len(percentile_array) > 0:
+            found_dist, found_percentile = _scan_rate_of_change(
+                percentile_array, scale_down
+            )
+            if not np.isnan(found_dist):
+                cut_dist = found_dist
+                cut_percentile = found_percentile
+                found = True
 
         # if still no result found, lower to 10% (1.1), 
         # if no result found then default is used
@@ -291,13 +423,13 @@ class LineInfo:
                 cut_percentile = 0.5
             elif 0.5 < median_percentile <= 5.0:
                 cut_dist = 4.5 * scale_down  # 4.0
-                cut_percentile = math.floor(median_percentile)
+                cut_percentile = floor_median
             elif 5.0 < median_percentile <= 10.0:
                 cut_dist = 5.5 * scale_down  # 5
-                cut_percentile = math.floor(median_percentile)
+                cut_percentile = floor_median
             elif 10.0 < median_percentile <= 15:
                 cut_dist = 6 * scale_down  # 5.5
-                cut_percentile = math.floor(median_percentile)
+                cut_percentile = floor_median
             elif 15 < median_percentile:
                 cut_dist = 5 * scale_down  # 5
                 cut_percentile = 15.5
@@ -309,46 +441,34 @@ class LineInfo:
             self.LDist_Cut = cut_dist
             self.CL_CutHt = float(cut_percentile)
 
-    def multi_ring_buffer(self, df, nrings, ringdist):
+    def multi_ring_buffer(self, line, nrings, ringdist):
         """
-        Buffers an input DataFrames geometry nring (number of rings) times.
+        Buffers an input line geometry nring (number of rings) times.
 
         Compute with a distance between rings of ringdist and returns 
         a list of non overlapping buffers
         """
+        # inner distance of each ring (0, 1, 2, ..., ringdist)
+        distances = np.arange(0, ringdist, nrings)
+        buffer_args = {"quad_segs": 16, "single_sided": True, "cap_style": "flat"}
+        big_rings = shapely.buffer(line, distances + nrings, **buffer_args)
+        small_rings = shapely.buffer(line, distances, **buffer_args)
+        # Difference the big with the small to create a ring
+        ring_geoms = shapely.difference(big_rings, small_rings)
+
         rings = []  # A list to hold the individual buffers
-        line = df.geometry.iloc[0]
-        # For each ring (1, 2, 3, ..., nrings)
-        for ring in np.arange(0, ringdist, nrings):  
-            big_ring = line.buffer(
-                nrings + ring, single_sided=True, cap_style="flat"
-            )  # Create one big buffer
-            small_ring = line.buffer(
-                ring, single_sided=True, cap_style="flat"
-            )  # Create one smaller one
-            the_ring = big_ring.difference(
-                small_ring
-            )  # Difference the big with the small to create a ring
-            if (
-                ~shapely.is_empty(the_ring)
-                or ~shapely.is_missing(the_ring)
-                or not None
-                or ~the_ring.area == 0
-            ):
-                if isinstance(the_ring, sh_geom.MultiPolygon) or isinstance(
-                    the_ring, shapely.Polygon
-                ):
-                    rings.append(the_ring)  # Append the ring to the rings list
-                else:
-                    if isinstance(the_ring, shapely.GeometryCollection):
-                        for i in range(0, len(the_ring.geoms)):
-                            if not isinstance(the_ring.geoms[i], shapely.LineString):
-                                rings.append(the_ring.geoms[i])
+        for the_ring in ring_geoms:
+            if isinstance(the_ring, (sh_geom.MultiPolygon, sh_geom.Polygon)):
+                rings.append(the_ring)  # Append the ring to the rings list
+            elif isinstance(the_ring, sh_geom.GeometryCollection):
+                for geom in the_ring.geoms:
+                    if not isinstance(geom, sh_geom.LineString):
+                        rings.append(geom)
 
         return rings  # return the list
 
     def prepare_line_buffer(self):
-        line = self.line.geometry.iloc[0]
+        line = self.line
         buffer_left_1 = line.buffer(
             distance=self.max_ln_width + 1,
             cap_style=3,
@@ -378,17 +498,13 @@ class LineInfo:
         # max_line_dist = self.max_line_dist
         # canopy_avoid = self.canopy_avoidance
         # exponent = self.exponent
-        line_df = self.line
-        out_meta = self.out_meta
-
-        canopy_thresh_percentage = self.canopy_thresh_percentage / 100
 
         if side == Side.left:
-            canopy_ht_threshold = line_df.CL_CutHt * canopy_thresh_percentage
+            canopy_ht_threshold = self.CL_CutHt * self.canopy_thresh_frac
             Cut_Dist = self.LDist_Cut
             line_buffer = self.buffer_left
         elif side == Side.right:
-            canopy_ht_threshold = line_df.CR_CutHt * canopy_thresh_percentage
+            canopy_ht_threshold = self.CR_CutHt * self.canopy_thresh_frac
             Cut_Dist = self.RDist_Cut
             line_buffer = self.buffer_right
         else:
@@ -406,7 +522,7 @@ class LineInfo:
 
         try:
             clipped_rasterC, out_meta = bt_common.clip_raster(
-                in_chm_raster, line_buffer, 0
+                _open_chm(in_chm_raster), line_buffer, 0
             )
             negative_cost_clip, dyn_canopy_ndarray = algo_cost.cost_raster(
                 clipped_rasterC,
@@ -437,59 +553,54 @@ class LineInfo:
         exp_shk_cell = self.exponent  # TODO: duplicate vars
         no_data = self.nodata
 
-        shapefile_proj = self.line.crs
         in_transform = in_meta["transform"]
 
-        segment_list = []
-
-        feat = self.line.geometry.iloc[0]
-        for coord in feat.coords:
-            segment_list.append(coord)
+        feat = self.line
 
-        cell_size_x = in_transform[0]
-        cell_size_y = -in_transform[4]
+        cell_size_x = self.cell_size if self.cell_size else in_transform[0]
 
         # Work out the corridor from both end of the centerline
         try:
             if len(in_cost_r.shape) > 2:
                 in_cost_r = np.squeeze(in_cost_r, axis=0)
+            in_cost_r = in_cost_r.astype(np.float32, copy=False)
+            in_canopy_r = in_canopy_r.astype(np.float32, copy=False)
 
-            algo_cost.remove_nan_from_array_refactor(in_cost_r)
-            in_cost_r[in_cost_r == no_data] = np.inf
+            # nan and nodata cells are impassable, in one pass
+            np.putmask(in_cost_r, np.isnan(in_cost_r) | (in_cost_r == no_data), np.inf)
 
             # generate 1m interval points along line
             distance_delta = 1
             distances = np.arange(0, feat.length, distance_delta)
-            multipoint_along_line = [
-                feat.interpolate(distance) for distance in distances
-            ]
-            multipoint_along_line.append(sh_geom.Point(segment_list[-1]))
-            # Rasterize points along line
-            rasterized_points_Alongln = ras_feat.rasterize(
-                multipoint_along_line,
-                out_shape=in_cost_r.shape,
-                transform=in_transform,
-                fill=0,
-                all_touched=True,
-                default_value=1,
+            multipoint_along_line = shapely.line_interpolate_point(feat, distances)
+            xs, ys = np.vstack(
+                [
+                    shapely.get_coordinates(multipoint_along_line),
+                    shapely.get_coordinates(feat)[-1:],  # line end point
+                ]
+            ).T
+
+            # cells of points along line, points outside of raster are dropped
+            rows, cols = rasterio.transform.rowcol(in_transform, xs, ys)
+            rows, cols = np.asarray(rows), np.asarray(cols)
+            in_raster = (
+                (rows >= 0)
+                & (rows < in_cost_r.shape[0])
+                & (cols >= 0)
+                & (cols < in_cost_r.shape[1])
             )
-            points_Alongln = np.transpose(np.nonzero(rasterized_points_Alongln))
+            points_Alongln = np.column_stack([rows[in_raster], cols[in_raster]])
 
-            # Find minimum cost paths through an N-d costs array.
-            mcp_flexible1 = MCP_Flexible(
-                in_cost_r, sampling=(cell_size_x, cell_size_y), fully_connected=True
-            )
-            flex_cost_alongLn, flex_back_alongLn = mcp_flexible1.find_costs(
-                starts=points_Alongln
-            )
+            # Find minimum cost from points along line
+            flex_cost_alongLn = _accumulated_cost(in_cost_r, points_Alongln)
 
             # Generate corridor
             corridor = flex_cost_alongLn
-            corridor = np.ma.masked_invalid(corridor)
+            finite = np.isfinite(corridor)
 
             # Calculate minimum value of corridor raster
-            if np.ma.min(corridor) is not None:
-                corr_min = float(np.ma.min(corridor))
+            if finite.any():
+                corr_min = float(corridor[finite].min())
             else:
                 corr_min = 0.5
 
@@ -501,39 +612,25 @@ class LineInfo:
             if corridor_th_value < 0:  # if no threshold found, use default value
                 corridor_th_value = bt_const.FP_CORRIDOR_THRESHOLD / cell_size_x
 
-            corridor_thresh = np.ma.where(corridor_norm >= corridor_th_value, 1.0, 0.0)
+            # unreachable cells are above any threshold
+            corridor_thresh = (corridor_norm >= corridor_th_value).astype(np.uint8)
             clean_raster = algo_common.morph_raster(
                 corridor_thresh, in_canopy_r, exp_shk_cell, cell_size_x
             )
 
             # create mask for non-polygon area
-            mask = np.where(clean_raster == 1, True, False)
-            if clean_raster.dtype == np.int64:
-                clean_raster = clean_raster.astype(np.int32)
+            clean_raster = clean_raster.astype(np.uint8, copy=False)
+            mask = clean_raster == 1
 
-            # Process: ndarray to shapely Polygon
+            # Process: ndarray to shapely MultiPolygon
             out_polygon = ras_feat.shapes(
                 clean_raster, mask=mask, transform=in_transform
             )
-
-            # create a shapely MultiPolygon
-            multi_polygon = []
-            for poly, value in out_polygon:
-                multi_polygon.append(sh_geom.shape(poly))
-            poly = sh_geom.MultiPolygon(multi_polygon)
-
-            # create a pandas DataFrame for the FP
-            out_data = pd.DataFrame(
-                {
-                    "CorriThresh": [corridor_th_value],
-                    "geometry": [poly]
-                }
-            )
-            out_gdata = gpd.GeoDataFrame(
-                out_data, geometry="geometry", crs=shapefile_proj
+            poly = sh_geom.MultiPolygon(
+                [sh_geom.shape(poly) for poly, _ in out_polygon]
             )
 
-            return out_gdata
+            return poly, corridor_th_value
 
         except Exception as e:
             print("Exception: {}".format(e))
@@ -552,10 +649,11 @@ def line_footprint_rel(
     canopy_avoidance=0.0,
     exponent=1.0,
     canopy_thresh_percentage=50,
+    parallel_mode=bt_const.PARALLEL_MODE,
 ):
     """Another version of relative canopy footprint tool."""
     footprint = FootprintCanopy(in_line, in_chm, in_layer)
-    footprint.compute(processes, bt_const.PARALLEL_MODE)
+    footprint.compute(processes, parallel_mode)
 
     # footprint.save_line_percentile(out_file_percentile)
     footprint.save_footprint(out_footprint, out_layer)
@@ -47,5 +47,6 @@ class ParallelMode(enum.IntEnum):
     DASK = 4
     SLURM = 5
     # RAY = 6
+    THREADING = 7
 
 PARALLEL_MODE = ParallelMode.MULTIPROCESSING
@@ -64,6 +64,30 @@ def print_msg(app_name, step, total_steps):
     print(f' %{step / total_steps * 100} ', flush=True)
 
 
+def _execute_with_executor(
+    executor_class, in_func, in_data, app_name, processes, verbose
+):
+    """Run in_func on in_data with a concurrent.futures executor class."""
+    out_result = []
+    step = 0
+    total_steps = len(in_data)
+    with executor_class(max_workers=processes) as executor:
+        futures = [executor.submit(in_func, line) for line in in_data]
+        with tqdm(total=total_steps, disable=verbose) as pbar:
+            for future in con_futures.as_completed(futures):
+                result_item = future.result()
+                if result_is_valid(result_item):
+                    out_result.append(result_item)
+
+                step += 1
+                if verbose:
+                    print_msg(app_name, step, total_steps)
+                else:
+                    pbar.update()
+
+    return out_result
+
+
 def execute_multiprocessing(
     in_func,
     in_data,
@@ -114,19 +138,25 @@ def execute_multiprocessing(
         elif mode == bt_const.ParallelMode.CONCURRENT:
             print("Concurrent processing started...", flush=True)
             print("Using {} CPU cores".format(processes), flush=True)
-            with con_futures.ProcessPoolExecutor(max_workers=processes) as executor:
-                futures = [executor.submit(in_func, line) for line in in_data]
-                with tqdm(total=total_steps, disable=verbose) as pbar:
-                    for future in con_futures.as_completed(futures):
-                        result_item = future.result()
-                        if result_is_valid(result_item):
-                            out_result.append(result_item)
-
-                        step += 1
-                        if verbose:
-                            print_msg(app_name, step, total_steps)
-                        else:
-                            pbar.update()
+            out_result = _execute_with_executor(
+                con_futures.ProcessPoolExecutor,
+                in_func,
+                in_data,
+                app_name,
+                processes,
+                verbose,
+            )
+        elif mode == bt_const.ParallelMode.THREADING:
+            print("Threading processing started...", flush=True)
+            print("Using {} threads".format(processes), flush=True)
+            out_result = _execute_with_executor(
+                con_futures.ThreadPoolExecutor,
+                in_func,
+                in_data,
+                app_name,
+                processes,
+                verbose,
+            )
         elif mode == bt_const.ParallelMode.DASK:
             print("Dask processing started...", flush=True)
             print("Using {} CPU cores".format(processes), flush=True)
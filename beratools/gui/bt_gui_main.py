@@ -12,6 +12,7 @@ Description:
 
     The purpose of this script is to provide main GUI functions.
 """
+import codecs
 import json
 import os
 import sys
@@ -22,14 +23,30 @@ from re import compile
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import beratools.core.constants as bt_const
-import beratools.tools.common as bt_common
 from beratools.gui import bt_data
 from beratools.gui.tool_widgets import ToolWidgets
 
 # A regular expression, to extract the % complete.
-progress_re = compile("Total complete: (\d+)%")
+progress_re = compile(r"Total complete: (\d+)%")
+
+# tool printouts of progress ' %37.5 ' and label ' "PROGRESS_LABEL Step 1 of 8" '
+tool_progress_re = compile(r"%(?P<pct>\d+(?:\.\d+)?)")
+tool_label_re = compile(r'"?\s*PROGRESS_LABEL\s*(?P<label>[^"\n]*)"?')
 bt = bt_data.BTData()
 
+# tree icons, created on first use after QApplication exists
+_ICON_CACHE = {}
+
+
+def _get_icon(file_name):
+    """Return the shared QIcon of an asset file."""
+    if file_name not in _ICON_CACHE:
+        _ICON_CACHE[file_name] = QtGui.QIcon(
+            os.path.join(bt_const.ASSETS_PATH, file_name)
+        )
+
+    return _ICON_CACHE[file_name]
+
 
 def simple_percent_parser(output):
     """
@@ -37,6 +54,10 @@ def simple_percent_parser(output):
 
     Return a single integer for the % progress.
     """
+    # plain substring test first, most output lines carry no progress
+    if "Total complete" not in output:
+        return None
+
     m = progress_re.search(output)
     if m:
         pc_complete = m.group(1)
@@ -45,26 +66,56 @@ def simple_percent_parser(output):
 
 class _SearchProxyModel(QtCore.QSortFilterProxyModel):
 
-    def setFilterRegExp(self, pattern):
+    def __init__(self, parent=None):
+        super(_SearchProxyModel, self).__init__(parent)
+        self._accepted = set()  # source indexes accepted by current filter
+        self._filter_text = ""
+
+    def setFilterRegularExpression(self, pattern):
+        # plain text is matched literally and case-insensitively
         if isinstance(pattern, str):
-            pattern = QtCore.QRegExp(
-                pattern, QtCore.Qt.CaseInsensitive, QtCore.QRegExp.FixedString
+            text = pattern
+            pattern = QtCore.QRegularExpression(
+                QtCore.QRegularExpression.escape(text),
+                QtCore.QRegularExpression.CaseInsensitiveOption,
             )
-        super(_SearchProxyModel, self).setFilterRegExp(pattern)
-
-    def _accept_index(self, idx):
-        if idx.isValid():
-            text = idx.data(QtCore.Qt.DisplayRole)
-            if self.filterRegExp().indexIn(text) >= 0:
-                return True
-            for row in range(idx.model().rowCount(idx)):
-                if self._accept_index(idx.model().index(row, 0, idx)):
-                    return True
-        return False
+        else:
+            text = pattern.pattern()
+
+        if text == self._filter_text:
+            return  # same filter, skip invalidating the proxy
+
+        self._filter_text = text
+        self._accepted = self._matched_indexes(text)
+        super(_SearchProxyModel, self).setFilterRegularExpression(pattern)
+
+    def _matched_indexes(self, text):
+        """Source indexes of items containing text, and of their ancestors."""
+        accepted = set()
+        model = self.sourceModel()
+        if model is None or not text:
+            return accepted
+
+        items = model.findItems(
+            text, QtCore.Qt.MatchContains | QtCore.Qt.MatchRecursive
+        )
+        for item in items:
+            while item is not None:
+                key = QtCore.QPersistentModelIndex(item.index())
+                if key in accepted:
+                    break
+
+                accepted.add(key)
+                item = item.parent()
+
+        return accepted
 
     def filterAcceptsRow(self, sourceRow, sourceParent):
+        if not self._filter_text:
+            return True
+
         idx = self.sourceModel().index(sourceRow, 0, sourceParent)
-        return self._accept_index(idx)
+        return QtCore.QPersistentModelIndex(idx) in self._accepted
 
 
 class BTTreeView(QtWidgets.QWidget):
@@ -79,8 +130,10 @@ class BTTreeView(QtWidgets.QWidget):
         self.tool_search = QtWidgets.QLineEdit()
         self.tool_search.setPlaceholderText('Search...')
 
+        # build tool tree before attaching the proxy, no filtering while inserting
         self.tags_model = _SearchProxyModel()
         self.tree_model = QtGui.QStandardItemModel()
+        first_child = self.create_model()
         self.tags_model.setSourceModel(self.tree_model)
         # self.tags_model.setDynamicSortFilter(True)
         self.tags_model.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
@@ -90,6 +143,9 @@ class BTTreeView(QtWidgets.QWidget):
         self.tree_view.setHeaderHidden(True)
         self.tree_view.setRootIsDecorated(True)
         self.tree_view.setUniformRowHeights(True)
+        self.tree_view.setIconSize(QtCore.QSize(16, 16))  # no per-row icon size query
+        self.tree_view.setAnimated(False)
+        self.tree_view.setAutoScroll(False)
         self.tree_view.setModel(self.tags_model)
 
         # layout
@@ -98,21 +154,22 @@ class BTTreeView(QtWidgets.QWidget):
         main_layout.addWidget(self.tree_view)
         self.setLayout(main_layout)
 
+        # filter once typing pauses
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self.apply_search)
+
         # signals
         self.tool_search.textChanged.connect(self.search_text_changed)
 
         # init
-        first_child = self.create_model()
-
         self.tree_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.tree_view.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
-        self.tree_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.tree_view.setFirstColumnSpanned(0, self.tree_view.rootIndex(), True)
-        self.tree_view.setUniformRowHeights(True)
 
         self.tree_model.setHorizontalHeaderLabels(['Tools'])
         self.tree_sel_model = self.tree_view.selectionModel()
-        self.tree_sel_model.selectionChanged.connect(self.tree_view_selection_changed)
 
         index = None
         # select recent tool
@@ -122,7 +179,9 @@ class BTTreeView(QtWidgets.QWidget):
             # index_set = self.tree_model.index(0, 0)
             index = self.tree_model.indexFromItem(first_child)
 
+        # initial selection is not a user change, connect afterwards
         self.select_tool_by_index(index)
+        self.tree_sel_model.selectionChanged.connect(self.tree_view_selection_changed)
         self.tree_view.collapsed.connect(self.tree_item_collapsed)
         self.tree_view.expanded.connect(self.tree_item_expanded)
 
@@ -132,28 +191,37 @@ class BTTreeView(QtWidgets.QWidget):
         return first_child
 
     def search_text_changed(self, text=None):
-        self.tags_model.setFilterRegExp(self.tool_search.text())
+        self._search_timer.start()  # restart on every keystroke
 
-        if len(self.tool_search.text()) >= 1 and self.tags_model.rowCount() > 0:
+    def apply_search(self):
+        text = self.tool_search.text()
+
+        # filter on collapsed tree, relayout once at the end
+        self.tree_view.setUpdatesEnabled(False)
+        self.tree_view.collapseAll()
+        self.tags_model.setFilterRegularExpression(text)
+        if text and self.tags_model.rowCount() > 0:
             self.tree_view.expandAll()
-        else:
-            self.tree_view.collapseAll()
+        self.tree_view.setUpdatesEnabled(True)
 
     def add_tool_list_to_tree(self, toolbox_list, sorted_tools):
         first_child = None
+        self._tool_indexes = {}  # tool name to source index
         for i, toolbox in enumerate(toolbox_list):
-            parent = QtGui.QStandardItem(
-                QtGui.QIcon(os.path.join(bt_const.ASSETS_PATH, "close.gif")), toolbox
-            )
-            for j, tool in enumerate(sorted_tools[i]):
-                child = QtGui.QStandardItem(
-                    QtGui.QIcon(os.path.join(bt_const.ASSETS_PATH, "tool.gif")), tool
-                )
-                if i == 0 and j == 0:
-                    first_child = child
-
-                parent.appendRow([child])
+            parent = QtGui.QStandardItem(_get_icon("close.gif"), toolbox)
+            children = [
+                QtGui.QStandardItem(_get_icon("tool.gif"), tool)
+                for tool in sorted_tools[i]
+            ]
+            if i == 0 and children:
+                first_child = children[0]
+
+            parent.appendRows(children)
             self.tree_model.appendRow(parent)
+            for child in children:
+                self._tool_indexes[child.text()] = QtCore.QPersistentModelIndex(
+                    child.index()
+                )
 
         return first_child
 
@@ -178,7 +246,7 @@ class BTTreeView(QtWidgets.QWidget):
             return
 
         if item.hasChildren():
-            item.setIcon(QtGui.QIcon(os.path.join(bt_const.ASSETS_PATH, 'open.gif')))
+            item.setIcon(_get_icon('open.gif'))
 
     def tree_item_collapsed(self, index):
         source_index = self.tags_model.mapToSource(index)
@@ -187,17 +255,14 @@ class BTTreeView(QtWidgets.QWidget):
             return
         
         if item.hasChildren():
-            item.setIcon(QtGui.QIcon(os.path.join(bt_const.ASSETS_PATH, 'close.gif')))
+            item.setIcon(_get_icon('close.gif'))
 
     def get_tool_index(self, tool_name):
-        item = self.tree_model.findItems(
-            tool_name, QtCore.Qt.MatchExactly | QtCore.Qt.MatchRecursive
-        )
-        if len(item) > 0:
-            item = item[0]
+        index = self._tool_indexes.get(tool_name)
+        if index is None:
+            return QtCore.QModelIndex()
 
-        index = self.tree_model.indexFromItem(item)
-        return index
+        return QtCore.QModelIndex(index)
 
     def select_tool_by_index(self, index):
         proxy_index = self.tags_model.mapFromSource(index)
@@ -274,11 +339,24 @@ class BTSlider(QtWidgets.QWidget):
         self.setLayout(layout)
 
         self.slider.sliderMoved.connect(self.slider_moved)
+        self.slider.valueChanged.connect(self.value_changed)
+        self.slider.sliderReleased.connect(self.commit_value)
 
     def slider_moved(self, value):
-        bt.set_max_procs(value)
         QtWidgets.QToolTip.showText(QtGui.QCursor.pos(), f'{value}')
-        self.label.setText(self.generate_label_text())
+        self.label.setText(self.generate_label_text(value))
+
+    def value_changed(self, value):
+        self.label.setText(self.generate_label_text(value))
+
+        # drags are saved on release, groove clicks, keys and wheel at once
+        if not self.slider.isSliderDown():
+            self.commit_value()
+
+    def commit_value(self):
+        value = self.slider.value()
+        if value != bt.get_max_procs():
+            bt.set_max_procs(value)
 
     def generate_label_text(self, value=None):
         if not value:
@@ -346,13 +424,45 @@ class BTListView(QtWidgets.QWidget):
     def set_data_list(self, data_list):
         self.list_model.setStringList(data_list)
 
+    def update_data_list(self, data_list):
+        """Update changed rows only, instead of resetting the whole model."""
+        old_list = self.list_model.stringList()
+        if old_list == data_list:
+            return
+
+        # skip common head and tail, history changes are mostly move to top
+        max_common = min(len(old_list), len(data_list))
+        head = 0
+        while head < max_common and old_list[head] == data_list[head]:
+            head += 1
+
+        tail = 0
+        while (
+            tail < max_common - head and old_list[-1 - tail] == data_list[-1 - tail]
+        ):
+            tail += 1
+
+        old_count = len(old_list) - head - tail
+        new_items = data_list[head : len(data_list) - tail]
+        common = min(old_count, len(new_items))
+
+        self.list_view.setUpdatesEnabled(False)
+        if old_count > common:
+            self.list_model.removeRows(head + common, old_count - common)
+        elif len(new_items) > common:
+            self.list_model.insertRows(head + common, len(new_items) - common)
+
+        for i, item in enumerate(new_items):
+            self.list_model.setData(self.list_model.index(head + i), item)
+        self.list_view.setUpdatesEnabled(True)
+
     def delete_selected_item(self):
         selection = self.sel_model.currentIndex()
         self.list_model.removeRow(selection.row())
         bt.remove_tool_history_item(selection.row())
 
     def clear_all_items(self):
-        self.list_model.setStringList([])
+        self.list_model.removeRows(0, self.list_model.rowCount())
         bt.remove_tool_history_all()
 
 
@@ -377,6 +487,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # QProcess run tools
         self.process = None
+        self._stdout_decoder = codecs.getincrementaldecoder("utf8")(errors="replace")
+        self._stdout_tail = ""
         self.cancel_op = False
 
         # BERA tool list
@@ -438,9 +550,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.btn_layout_top.addWidget(self.btn_advanced)
         self.btn_layout_top.addWidget(btn_code)
 
-        # ToolWidgets
-        tool_args = bt.get_bera_tool_args(self.tool_name)
-        self.tool_widget = ToolWidgets(self.recent_tool, tool_args, bt.show_advanced)
+        # ToolWidgets, one cached per tool and swapped in a stacked widget
+        self._tool_widgets = {}
+        self._tool_stack = QtWidgets.QStackedWidget()
+        self.tool_widget = self.get_tool_widget(self.tool_name)
 
         # bottom buttons
         slider = BTSlider(bt.max_procs, bt.max_cpu_cores)
@@ -462,7 +575,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.top_right_layout = QtWidgets.QVBoxLayout()
         self.top_right_layout.addLayout(self.btn_layout_top)
-        self.top_right_layout.addWidget(self.tool_widget)
+        self.top_right_layout.addWidget(self._tool_stack)
         self.top_right_layout.addLayout(btn_layout_bottom)
         tool_widget_grp = QtWidgets.QGroupBox('Tool')
         tool_widget_grp.setLayout(self.top_right_layout)
@@ -471,6 +584,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.text_edit = QtWidgets.QPlainTextEdit()
         self.text_edit.setFont(QtGui.QFont('Consolas', 9))
         self.text_edit.setReadOnly(True)
+
+        # tool output is buffered and written to text widget at most ~30 times/s
+        self._out_buf = []
+        self._out_timer = QtCore.QTimer(self)
+        self._out_timer.setSingleShot(True)
+        self._out_timer.setInterval(33)
+        self._out_timer.timeout.connect(self.flush_output)
         self.print_about()
 
         # progress bar
@@ -510,17 +630,31 @@ class MainWindow(QtWidgets.QMainWindow):
         # let tree view select the tool
         self.tree_view.select_tool_by_name(self.tool_name)
         self.tool_api = bt.get_bera_tool_api(self.tool_name)
-        tool_args = bt.get_bera_tool_args(self.tool_name)
 
         # update tool label
         self.btn_layout_top.itemAt(0).widget().setText(self.tool_name)
 
         # update tool widget
-        self.tool_widget = ToolWidgets(self.tool_name, tool_args, bt.show_advanced)
-        widget = self.top_right_layout.itemAt(1).widget()
-        self.top_right_layout.removeWidget(widget)
-        self.top_right_layout.insertWidget(1, self.tool_widget)
-        self.top_right_layout.update()
+        self.tool_widget = self.get_tool_widget(self.tool_name)
+
+    def get_tool_widget(self, tool_name):
+        """Show the cached widgets of the tool, build them on first use."""
+        widget = self._tool_widgets.get(tool_name)
+        if widget is None:
+            tool_args = bt.get_bera_tool_args(tool_name)
+            widget = ToolWidgets(tool_name, tool_args, bt.show_advanced)
+            self._tool_widgets[tool_name] = widget
+            self._tool_stack.addWidget(widget)
+
+        self._tool_stack.setCurrentWidget(widget)
+        return widget
+
+    def clear_tool_widgets(self):
+        for widget in self._tool_widgets.values():
+            self._tool_stack.removeWidget(widget)
+            widget.deleteLater()
+
+        self._tool_widgets.clear()
 
     def save_tool_parameter(self):
         # Retrieve tool parameters from GUI
@@ -531,7 +665,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # update tool history list
         bt.get_tool_history()
-        self.tool_history.set_data_list(bt.tool_history)
+        self.tool_history.update_data_list(bt.tool_history)
 
     def get_current_tool_parameters(self):
         self.tool_api = bt.get_bera_tool_api(self.tool_name)
@@ -542,10 +676,12 @@ class MainWindow(QtWidgets.QMainWindow):
         webbrowser.open_new_tab(self.get_current_tool_parameters()['tech_link'])
 
     def print_about(self):
+        self._out_buf.clear()
         self.text_edit.clear()
         self.print_to_output(bt.about())
 
     def print_license(self):
+        self._out_buf.clear()
         self.text_edit.clear()
         self.print_to_output(bt.license())
 
@@ -553,15 +689,25 @@ class MainWindow(QtWidgets.QMainWindow):
         max_procs = int(value)
         bt.set_max_procs(max_procs)
 
-    def print_to_output(self, text):
+    def write_output(self, text):
+        self._out_buf.append(str(text))
+        if not self._out_timer.isActive():
+            self._out_timer.start()
+
+    def flush_output(self):
+        if not self._out_buf:
+            return
+
         self.text_edit.moveCursor(QtGui.QTextCursor.End)
-        self.text_edit.insertPlainText(text)
+        self.text_edit.insertPlainText("".join(self._out_buf))
+        self._out_buf.clear()
         self.text_edit.moveCursor(QtGui.QTextCursor.End)
 
+    def print_to_output(self, text):
+        self.write_output(text)
+
     def print_line_to_output(self, text, tag=None):
-        self.text_edit.moveCursor(QtGui.QTextCursor.End)
-        self.text_edit.insertPlainText(text + '\n')
-        self.text_edit.moveCursor(QtGui.QTextCursor.End)
+        self.write_output(text + '\n')
 
     def show_advanced(self):
         if bt.show_advanced:
@@ -571,6 +717,8 @@ class MainWindow(QtWidgets.QMainWindow):
             bt.show_advanced = True
             self.btn_advanced.setText("Hide Advanced Options")
 
+        # cached widgets were built for the other mode
+        self.clear_tool_widgets()
         self.set_tool()
 
     def view_code(self):
@@ -586,30 +734,29 @@ class MainWindow(QtWidgets.QMainWindow):
             if rm_str in value:
                 value = value.replace(rm_str, '')
 
-        if "%" in value:
-            try:
-                str_progress = bt_common.extract_string_from_printout(value, '%')
-
-                # remove progress string
-                value = value.replace(str_progress, '').strip()  
-                progress = float(str_progress.replace("%", "").strip())
-                self.progress_bar.setValue(int(progress))
-            except ValueError as e:
-                print("custom_callback: Problem parsing data into number: ", e)
-            except Exception as e:
-                print(e)
-        elif 'PROGRESS_LABEL' in value:
-            str_label = bt_common.extract_string_from_printout(value, 'PROGRESS_LABEL')
-            value = value.replace(str_label, '').strip()  # remove progress string
+        progress = tool_progress_re.search(value) if '%' in value else None
+        label = None
+        if not progress and 'PROGRESS_LABEL' in value:
+            label = tool_label_re.search(value)
+        if progress:
+            # remove progress string
+            value = (value[: progress.start()] + value[progress.end() :]).strip()
+            self.progress_bar.setValue(int(float(progress.group("pct"))))
+        elif label:
+            # remove progress label string
+            value = (value[: label.start()] + value[label.end() :]).strip()
             value = value.replace('"', '')
-            str_label = str_label.replace("PROGRESS_LABEL", "").strip()
-            self.progress_label.setText(str_label)
+            self.progress_label.setText(label.group("label").strip())
 
         if value:
             self.print_line_to_output(value)
 
     def message(self, s):
-        self.text_edit.appendPlainText(s)
+        # new paragraph as appendPlainText
+        if self._out_buf or not self.text_edit.document().isEmpty():
+            s = '\n' + s
+
+        self.write_output(s)
 
     def load_default_args(self):
         self.tool_widget.load_default_args()
@@ -631,15 +778,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.save_tool_parameter()
 
         # Run the tool and check the return value for an error
-        for key in args.keys():
-            if type(args[key]) is not str:
-                args[key] = str(args[key])
+        args = {k: v if isinstance(v, str) else str(v) for k, v in args.items()}
 
         tool_type, tool_args = bt.run_tool(self.tool_api, args, self.custom_callback)
 
         if self.process is None:  # No process running.
             self.print_line_to_output(f"Tool {self.tool_name} started")
             self.print_line_to_output("-----------------------")
+            self._stdout_decoder.reset()
+            self._stdout_tail = ""
+            self.cancel_op = False
             self.process = QtCore.QProcess()  # Keep a reference to the QProcess
             self.process.readyReadStandardOutput.connect(self.handle_stdout)
             self.process.readyReadStandardError.connect(self.handle_stderr)
@@ -649,14 +797,6 @@ class MainWindow(QtWidgets.QMainWindow):
             self.process.finished.connect(self.process_finished)  
             self.process.start(tool_type, tool_args)
 
-        while self.process is not None:
-            sys.stdout.flush()
-            if self.cancel_op:
-                self.cancel_op = False
-                self.process.terminate()
-            else:
-                break
-
     def stop_process(self):
         self.cancel_op = True
         if self.process:
@@ -674,11 +814,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.message(stderr)
 
     def handle_stdout(self):
-        line = self.process.readLine()
-        line = bytes(line).decode("utf8")
+        # read all available output, keep incomplete last line for next read
+        data = self._stdout_decoder.decode(bytes(self.process.readAllStandardOutput()))
+        lines = (self._stdout_tail + data).split("\n")
+        self._stdout_tail = lines.pop()
 
         # process line output
-        self.custom_callback(line)
+        for line in lines:
+            self.custom_callback(line + "\n")
         sys.stdout.flush()
 
     def handle_state(self, state):
@@ -696,6 +839,11 @@ class MainWindow(QtWidgets.QMainWindow):
             self.btn_run.setEnabled(False)
 
     def process_finished(self):
+        self._stdout_tail += self._stdout_decoder.decode(b"", final=True)
+        if self._stdout_tail:
+            self.custom_callback(self._stdout_tail)
+            self._stdout_tail = ""
+
         self.message("Process finished.")
         self.process = None
         self.progress_bar.setValue(0)
@@ -13,6 +13,7 @@ Description:
     This file is intended to be hosting common classes/functions for BERA Tools
 """
 import argparse
+import contextlib
 import json
 import shlex
 import warnings
@@ -58,7 +59,14 @@ def clip_raster(
     default_nodata=bt_const.BT_NODATA,
 ):
     out_meta = None
-    with rasterio.open(in_raster_file) as raster_file:
+
+    # an already opened dataset is reused and left open for the caller
+    if isinstance(in_raster_file, rasterio.io.DatasetReader):
+        raster_context = contextlib.nullcontext(in_raster_file)
+    else:
+        raster_context = rasterio.open(in_raster_file)
+
+    with raster_context as raster_file:
         out_meta = raster_file.meta
         ras_nodata = out_meta["nodata"]
         if ras_nodata is None:
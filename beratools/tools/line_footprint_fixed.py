@@ -12,14 +12,13 @@ Description:
 
     This file hosts the line_footprint_fixed tool.
 """
-import math
 import time
 from itertools import chain
 from pathlib import Path
 
 import geopandas as gpd
 import numpy as np
-import pandas as pd
+import shapely
 import shapely.geometry as sh_geom
 import shapely.ops as sh_ops
 
@@ -31,7 +30,7 @@ from beratools.core.tool_base import execute_multiprocessing
 
 FP_FIXED_WIDTH_DEFAULT = 5.0
 
-def prepare_line_args(line_gdf, poly_gdf, n_samples, offset):
+def prepare_line_args(line_gdf, poly_gdf, n_samples, offset, max_width=False):
     """
     Generate arguments for each line in the GeoDataFrame.
 
@@ -40,31 +39,46 @@ def prepare_line_args(line_gdf, poly_gdf, n_samples, offset):
         poly_gdf
         n_samples
         offset
+        max_width : use max width or not to produce buffer
 
     Returns:
         line_args : list
-            row :
-            inter_poly :
+            line :
+            inter_poly : footprint polygons near the line
             n_samples :
             offset :
             i :  line ID
+            max_width :
 
     """
-    spatial_index = poly_gdf.sindex
     line_args = []
 
-    for row in line_gdf.itertuples():
-        line = row.geometry
-
-        # Skip rows where geometry is None
-        if line is None:
-            print(row)
-            continue
-
-        inter_poly = poly_gdf.loc[spatial_index.query(line)]
+    # Skip rows where geometry is None
+    valid = line_gdf.geometry.notna()
+    if not valid.all():
+        print(line_gdf[~valid])
+        line_gdf = line_gdf[valid]
+
+    # query polygons of all lines at once, then group them by line
+    line_idx, poly_idx = poly_gdf.sindex.query(line_gdf.geometry.values)
+    order = np.argsort(line_idx, kind="stable")
+    line_idx, poly_idx = line_idx[order], poly_idx[order]
+    splits = np.searchsorted(line_idx, np.arange(len(line_gdf) + 1))
+
+    # plain geometry array, no GeoDataFrame slice built and pickled per line
+    poly_geoms = poly_gdf.geometry.to_numpy()
+    for i, index in enumerate(line_gdf.index):
+        inter_poly = poly_geoms[poly_idx[splits[i] : splits[i + 1]]]
         try:
             line_args.append(
-                [line_gdf.loc[[row.Index]], inter_poly, n_samples, offset, row.Index]
+                [
+                    line_gdf.geometry[index],
+                    inter_poly,
+                    n_samples,
+                    offset,
+                    index,
+                    max_width,
+                ]
             )
         except Exception as e:
             print(e)
@@ -98,171 +112,121 @@ def generate_sample_points(line, n_samples=10):
 
 
 def process_single_line(line_arg):
-    row = line_arg[0]
+    line = line_arg[0]
     inter_poly = line_arg[1]
     n_samples = line_arg[2]
     offset = line_arg[3]
-    # line_id = line_arg[4]
+    line_id = line_arg[4]
+    max_width = line_arg[5]
 
     # TODO: deal with case when inter_poly is empty
     widths, line, perp_lines, perp_lines_original = calculate_average_width(
-        row.iloc[0].geometry, inter_poly, offset, n_samples
+        line, inter_poly, offset, n_samples
     )
 
     # Calculate the 75th percentile width
     # filter zeros in width array
-    arr_filter = [False if math.isclose(i, 0.0) else True for i in widths]
-    widths = widths[arr_filter]
+    widths = widths[widths != 0.0]
 
     q3_width = FP_FIXED_WIDTH_DEFAULT
     q4_width = FP_FIXED_WIDTH_DEFAULT
     try:
-        q3_width = np.percentile(widths, 40)
-        q4_width = np.percentile(widths, 90)
-    except Exception as e:
-        print(e)
-
-    # Store the 75th percentile width as a new attribute
-    row["avg_width"] = q3_width
-    row["max_width"] = q4_width
-
-    row["geometry"] = line
-    try:
-        row["perp_lines"] = perp_lines
-        row["perp_lines_original"] = perp_lines_original
+        q3_width, q4_width = np.percentile(widths, [40, 90])
     except Exception as e:
         print(e)
 
-    return row
-
-
-def generate_fixed_width_footprint(line_gdf, max_width=False):
-    """
-    Create a buffer around each line.
-     
-    In the GeoDataFrame using its 'max_width' attribute and
-    saves the resulting polygons in a new shapefile.
-
-    Args:
-    line_gdf: GeoDataFrame containing LineString with 'max_width' attribute.
-    max_width: Use max width or not to produce buffer.
-
-    """
-    # Create a new GeoDataFrame with the buffer polygons
-    buffer_gdf = line_gdf.copy(deep=True)
-
-    mean_avg_width = line_gdf["avg_width"].mean()
-    mean_max_width = line_gdf["max_width"].mean()
-
-    # Use .loc to avoid chained assignment
-    line_gdf.loc[line_gdf["avg_width"].isna(), "avg_width"] = mean_avg_width
-    line_gdf.loc[line_gdf["max_width"].isna(), "max_width"] = mean_max_width
-
-    line_gdf.loc[line_gdf["avg_width"] == 0.0, "avg_width"] = mean_avg_width
-    line_gdf.loc[line_gdf["max_width"] == 0.0, "max_width"] = mean_max_width
-
+    # widths are never missing or zero here, buffer the line in the worker
     if not max_width:
-        print("Using quantile 75% width")
-        buffer_gdf["geometry"] = line_gdf.apply(
-            lambda row: row.geometry.buffer(row.avg_width / 2)
-            if row.geometry is not None
-            else None,
-            axis=1,
-        )
+        buffer_dist = q3_width / 2
     else:
-        print("Using quantile 90% + 20% width")
-        buffer_gdf["geometry"] = line_gdf.apply(
-            lambda row: row.geometry.buffer(row.max_width * 1.2 / 2)
-            if row.geometry is not None
-            else None,
-            axis=1,
-        )
+        buffer_dist = q4_width * 1.2 / 2
 
-    return buffer_gdf
+    # Store the 75th percentile width as a new attribute
+    return {
+        "line_id": line_id,
+        "avg_width": q3_width,
+        "max_width": q4_width,
+        "perp_lines": perp_lines,
+        "perp_lines_original": perp_lines_original,
+        "footprint": line.buffer(buffer_dist, quad_segs=16),
+    }
 
 
-def smooth_linestring(line, tolerance=1.0):
+def smooth_linestring(lines, tolerance=1.0):
     """
-    Smooths a LineString geometry using the Ramer-Douglas-Peucker algorithm.
+    Smooths LineString geometries using the Ramer-Douglas-Peucker algorithm.
+
+    Smoothing is currently disabled, lines are returned unchanged.
 
     Args:
-    line: The LineString geometry to smooth.
+    lines: Array of LineString geometries to smooth.
     tolerance: The maximum distance from a point to a line for the point 
         to be considered part of the line.
 
     Returns:
-    The smoothed LineString geometry.
+    The smoothed LineString geometries.
 
     """
-    # simplified_line = line.simplify(tolerance)
-    simplified_line = line
-    return simplified_line
+    # simplified_lines = shapely.simplify(lines, tolerance)
+    simplified_lines = lines
+    return simplified_lines
 
 
 def calculate_average_width(line, polygon, offset, n_samples):
     """Calculate the average width of a polygon perpendicular to the given line."""
-    # Smooth the line
-    line = smooth_linestring(line, tolerance=1.0)
-
-    valid_widths = 0
     sample_points = generate_sample_points(line, n_samples=n_samples)
     sample_points_pairs = list(
         zip(sample_points[:-2], sample_points[1:-1], sample_points[2:])
     )
     widths = np.zeros(len(sample_points_pairs))
-    perp_lines = []
-    perp_lines_original = []
-
-    # remove polygon holes
-    poly_list = []
-    for geom in polygon.geometry:
-        if type(geom) is sh_geom.MultiPolygon:
-            for item in geom.geoms:
-                poly_list.append(sh_geom.Polygon(list(item.exterior.coords)))
-        else:
-            poly_list.append(sh_geom.Polygon(list(geom.exterior.coords)))
 
-    polygon_no_holes = gpd.GeoDataFrame(geometry=poly_list, crs=polygon.crs)
+    # polygon holes are removed in remove_polygon_holes beforehand
+    poly_list = shapely.get_parts(polygon)
+    poly_tree = shapely.STRtree(poly_list)
 
+    perp_arr = np.empty(len(sample_points_pairs), dtype=object)
     for i, points in enumerate(sample_points_pairs):
-        perp_line = algo_common.generate_perpendicular_line_precise(
+        perp_arr[i] = algo_common.generate_perpendicular_line_precise(
             points, offset=offset
         )
-        perp_lines_original.append(perp_line)
 
-        polygon_intersect = polygon_no_holes.iloc[
-            polygon_no_holes.sindex.query(perp_line)
-        ]
-        intersections = polygon_intersect.intersection(perp_line)
+    # intersect all perpendicular lines with polygons in one batch
+    perp_idx, poly_idx = poly_tree.query(perp_arr, predicate="intersects")
+    intersections = shapely.intersection(perp_arr[perp_idx], poly_list[poly_idx])
 
-        line_list = []
-        try:
-            for inter in intersections:
-                if not inter.is_empty:
-                    if type(inter) is sh_geom.MultiLineString:
-                        line_list += list(inter.geoms)
-                    else:
-                        line_list.append(inter)
-
-            perp_lines += line_list
-        except Exception as e:
-            print(e)
-
-        try:
-            for item in line_list:
-                widths[i] = max(widths[i], item.length)
-                valid_widths += 1
-        except Exception as e:
-            print(e)
+    # split multi-part intersections, width is the longest part per sample
+    parts, part_idx = shapely.get_parts(intersections, return_index=True)
+    part_perp_idx = perp_idx[part_idx]
+    non_empty = ~shapely.is_empty(parts)
+    parts = parts[non_empty]
+    np.maximum.at(widths, part_perp_idx[non_empty], shapely.length(parts))
 
     return (
         widths,
         line,
-        sh_geom.MultiLineString(perp_lines),
-        sh_geom.MultiLineString(perp_lines_original),
+        shapely.multilinestrings(parts),
+        shapely.multilinestrings(perp_arr),
     )
 
 
+def remove_polygon_holes(polygons):
+    """
+    Remove holes of polygons.
+
+    Args:
+        polygons: array of Polygon or MultiPolygon
+
+    Returns:
+        array of MultiPolygon, one for each input geometry
+
+    """
+    parts, index = shapely.get_parts(polygons, return_index=True)
+    exteriors = shapely.polygons(shapely.get_exterior_ring(parts))
+    out = np.full(len(polygons), None, dtype=object)
+
+    return shapely.multipolygons(exteriors, indices=index, out=out)
+
+
 def line_footprint_fixed(
     in_line,
     in_footprint,
@@ -281,25 +245,59 @@ def line_footprint_fixed(
     offset = float(offset)
     line_gdf = gpd.read_file(in_line, layer=in_layer)
     poly_gdf = gpd.read_file(in_footprint, layer=in_layer_fp)
+    poly_gdf = gpd.GeoDataFrame(
+        geometry=remove_polygon_holes(poly_gdf.geometry.values), crs=poly_gdf.crs
+    )
 
     lg = LineGrouping(line_gdf)
     lg.run_grouping()
     merged_line_gdf = LineGrouping.run_line_merge(line_gdf)
 
-    line_args = prepare_line_args(merged_line_gdf, poly_gdf, n_samples, offset)
+    # Smooth all lines in one call, merged lines are saved unchanged
+    smooth_line_gdf = merged_line_gdf.set_geometry(
+        smooth_linestring(merged_line_gdf.geometry.values, tolerance=1.0),
+        crs=merged_line_gdf.crs,
+    )
+
+    if not max_width:
+        print("Using quantile 75% width")
+    else:
+        print("Using quantile 90% + 20% width")
+
+    line_args = prepare_line_args(
+        smooth_line_gdf, poly_gdf, n_samples, offset, max_width
+    )
     del poly_gdf
 
     out_lines = execute_multiprocessing(
         process_single_line, line_args, "Fixed footprint", processes, mode=parallel_mode
     )
-    line_attr = pd.concat(out_lines)
 
-    # create fixed width footprint
-    buffer_gdf = generate_fixed_width_footprint(line_attr, max_width=max_width)
+    # rebuild line attributes once from per line results, in result order
+    line_attr = smooth_line_gdf.loc[[item["line_id"] for item in out_lines]]
+    for col in ("avg_width", "max_width", "perp_lines", "perp_lines_original"):
+        line_attr[col] = [item[col] for item in out_lines]
+
+    # fixed width footprint, lines are buffered by the workers
+    buffer_gdf = line_attr.copy()
+    buffer_gdf["geometry"] = gpd.GeoSeries(
+        [item["footprint"] for item in out_lines],
+        index=buffer_gdf.index,
+        crs=line_attr.crs,
+    )
 
     # Save the lines with attributes and polygons to a new file
-    perp_lines_gdf = buffer_gdf.copy(deep=True)
-    perp_lines_original_gdf = buffer_gdf.copy(deep=True)
+    # select columns of aux layers instead of deep copying the whole frame
+    perp_lines_gdf = gpd.GeoDataFrame(
+        buffer_gdf.drop(columns=["geometry", "perp_lines_original"]),
+        geometry="perp_lines",
+        crs=buffer_gdf.crs,
+    )
+    perp_lines_original_gdf = gpd.GeoDataFrame(
+        buffer_gdf.drop(columns=["geometry", "perp_lines"]),
+        geometry="perp_lines_original",
+        crs=buffer_gdf.crs,
+    )
 
     # save fixed width footprint
     buffer_gdf = buffer_gdf.drop(columns=["perp_lines"])
@@ -308,7 +306,9 @@ def line_footprint_fixed(
     buffer_gdf.reset_index(inplace=True, drop=True)
 
     # save original merged lines
-    merged_line_gdf.to_file(out_footprint, layer="merged_lines_original")
+    merged_line_gdf.to_file(
+        out_footprint, layer="merged_lines_original", engine="pyogrio"
+    )
 
     # trim lines and footprints
     lg.run_cleanup(buffer_gdf)
@@ -320,26 +320,20 @@ def line_footprint_fixed(
     out_aux_gpkg = out_footprint.with_stem(out_footprint.stem + "_aux").with_suffix(
         ".gpkg"
     )
-    perp_lines_gdf = perp_lines_gdf.set_geometry("perp_lines")
-    perp_lines_gdf = perp_lines_gdf.drop(columns=["perp_lines_original"])
-    perp_lines_gdf = perp_lines_gdf.drop(columns=["geometry"])
     perp_lines_gdf = perp_lines_gdf.set_crs(buffer_gdf.crs, allow_override=True)
-    perp_lines_gdf.to_file(out_aux_gpkg.as_posix(), layer=layer)
+    perp_lines_gdf.to_file(out_aux_gpkg.as_posix(), layer=layer, engine="pyogrio")
 
     layer = "perp_lines_original"
-    perp_lines_original_gdf = perp_lines_original_gdf.set_geometry(
-        "perp_lines_original"
-    )
-    perp_lines_original_gdf = perp_lines_original_gdf.drop(columns=["perp_lines"])
-    perp_lines_original_gdf = perp_lines_original_gdf.drop(columns=["geometry"])
     perp_lines_original_gdf = perp_lines_original_gdf.set_crs(
         buffer_gdf.crs, allow_override=True
     )
-    perp_lines_original_gdf.to_file(out_aux_gpkg.as_posix(), layer=layer)
+    perp_lines_original_gdf.to_file(
+        out_aux_gpkg.as_posix(), layer=layer, engine="pyogrio"
+    )
 
     layer = "centerline_simplified"
     line_attr = line_attr.drop(columns="perp_lines")
-    line_attr.to_file(out_aux_gpkg.as_posix(), layer=layer)
+    line_attr.to_file(out_aux_gpkg.as_posix(), layer=layer, engine="pyogrio")
 
     print("Fixed width footprint tool finished.")
 
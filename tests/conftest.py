@@ -34,7 +34,6 @@ def pytest_configure(config):
     logging.getLogger('pyogrio').setLevel(logging.ERROR)
     logging.getLogger('rasterio').setLevel(logging.ERROR)
     logging.getLogger('rasterio.env').setLevel(logging.ERROR)
-    logging.getLogger('label_centerlines._src').setLevel(logging.ERROR)
     
 # Fixture to get the path to the 'data' directory
 @pytest.fixture
@@ -1,8 +1,27 @@
 """Test functions and command lines."""
 
 import geopandas as gpd
+import numpy as np
 import pytest
-from label_centerlines import get_centerline
+import rasterio
+import rasterio.features
+import shapely
+import shapely.geometry as sh_geom
+import skimage.graph as sk_graph
+
+import beratools.core.algo_dijkstra as algo_dijkstra
+import beratools.core.algo_footprint_rel as algo_footprint_rel
+from beratools.core.algo_centerline import (
+    find_centerline,
+    find_centerlines_batched,
+    get_centerline,
+)
+from beratools.core.algo_dijkstra import (
+    dijkstra,
+    find_least_cost_path,
+    find_least_cost_paths_batch,
+)
+from beratools.core.algo_footprint_rel import LineInfo
 
 
 # Fixture to load the 'alps.geojson' shape using geopandas
@@ -18,4 +37,292 @@ def footprint_shape(testdata_dir):
 def test_centerline(footprint_shape):
     cl = get_centerline(footprint_shape)
     assert cl.is_valid
-    assert cl.geom_type == "MultiLineString"
\ No newline at end of file
+    assert cl.geom_type == "MultiLineString"
+
+
+# Test centerline of simple corridors
+def test_centerline_straight_corridor():
+    poly = sh_geom.box(0, 0, 100, 10)
+    cl = get_centerline(poly)
+    assert cl.geom_type == "LineString"
+    assert poly.contains(cl)
+    assert 90 < cl.length < 110
+
+    # ends at the two short sides, middle runs along the corridor axis
+    ends = sorted([cl.coords[0][0], cl.coords[-1][0]])
+    assert ends[0] < 5 and ends[1] > 95
+    assert abs(cl.interpolate(0.5, normalized=True).y - 5) < 1
+
+
+def test_centerline_bent_corridor():
+    axis = sh_geom.LineString([(0, 0), (60, 0), (60, 50)])
+    poly = axis.buffer(5, cap_style="flat")
+    cl = get_centerline(poly)
+    assert cl.geom_type == "LineString"
+    assert poly.contains(cl)
+    assert 100 < cl.length < 120
+
+    ends = [sh_geom.Point(cl.coords[0]), sh_geom.Point(cl.coords[-1])]
+    starts = [sh_geom.Point(0, 0), sh_geom.Point(60, 50)]
+    assert min(ends[0].distance(starts[0]), ends[1].distance(starts[0])) < 8
+    assert min(ends[0].distance(starts[1]), ends[1].distance(starts[1])) < 8
+    assert cl.hausdorff_distance(axis) < 8
+
+
+# Batched centerlines must match the single polygon path
+def test_centerlines_batched_match_single():
+    axes = [
+        sh_geom.LineString([(0, 0), (100, 0)]),
+        sh_geom.LineString([(0, 0), (60, 0), (60, 50)]),
+        sh_geom.LineString([(0, 0), (40, 30), (80, 20)]),
+        sh_geom.LineString([(0, 0), (100, 0)]),
+        sh_geom.LineString([(0, 0), (100, 0)]),
+    ]
+    polys = [axis.buffer(6, cap_style="flat") for axis in axes[:3]]
+
+    # corridor with a hole, and a split corridor that can not be merged
+    polys.append(polys[0].difference(sh_geom.Point(50, 0).buffer(2)))
+    polys.append(
+        sh_geom.MultiPolygon([sh_geom.box(0, -5, 40, 5), sh_geom.box(60, -5, 100, 5)])
+    )
+    lines = [shapely.offset_curve(axis, 1) for axis in axes]
+
+    batched = find_centerlines_batched(polys, lines)
+    assert len(batched) == len(polys)
+    for poly, line, (cl_batch, status_batch) in zip(polys, lines, batched):
+        cl_single, status_single = find_centerline(poly, line)
+        assert status_batch == status_single
+        assert cl_batch.equals_exact(cl_single, 1e-9)
+
+
+# Cost raster with a few impassable cells for least cost path tests
+@pytest.fixture
+def cost_raster():
+    rng = np.random.default_rng(0)
+    cost = rng.uniform(1.0, 10.0, (40, 50)).astype(np.float32)
+    cost[rng.random(cost.shape) < 0.1] = np.inf
+    cost[0, 0] = cost[39, 49] = cost[5, 45] = cost[30, 3] = 1.0
+    return cost
+
+
+class _Feedback:
+    def setProgress(self, value):
+        pass
+
+    def isCanceled(self):
+        return False
+
+
+def _mcp_costs(cost, start):
+    mcp = sk_graph.MCP_Geometric(cost, fully_connected=True)
+    cum_costs, _ = mcp.find_costs([start])
+    return cum_costs
+
+
+def _path_cost(cost, path):
+    total = 0.0
+    for (r1, c1), (r2, c2) in zip(path[:-1], path[1:]):
+        assert max(abs(r1 - r2), abs(c1 - c2)) == 1
+        factor = np.hypot(r1 - r2, c1 - c2)
+        total += factor * (cost[r1, c1] + cost[r2, c2]) / 2
+    return total
+
+
+def _end_tuples(cells):
+    return [(cell, sh_geom.Point(cell), i) for i, cell in enumerate(cells)]
+
+
+# Compiled dijkstra must find paths as cheap as skimage MCP_Geometric
+@pytest.mark.parametrize("feedback", [None, _Feedback()])
+@pytest.mark.parametrize("find_nearest", [True, False])
+def test_dijkstra_single_end(cost_raster, feedback, find_nearest):
+    start, end = (0, 0), (39, 49)
+    cum_costs = _mcp_costs(cost_raster, start)
+    result = dijkstra(
+        _end_tuples([start])[0], _end_tuples([end]), cost_raster, find_nearest, feedback
+    )
+
+    assert len(result) == 1
+    path, costs, end_tuples = result[0]
+    assert tuple(path[0]) == start
+    assert tuple(path[-1]) == end
+    assert end_tuples[0][0] == end
+    assert costs[-1] == pytest.approx(cum_costs[end], rel=1e-5)
+    assert _path_cost(cost_raster, path) == pytest.approx(costs[-1], rel=1e-5)
+
+
+@pytest.mark.parametrize("feedback", [None, _Feedback()])
+def test_dijkstra_multiple_ends(cost_raster, feedback):
+    start = (0, 0)
+    ends = [(39, 49), (5, 45), (30, 3)]
+    cum_costs = _mcp_costs(cost_raster, start)
+
+    result = dijkstra(
+        _end_tuples([start])[0], _end_tuples(ends), cost_raster, False, feedback
+    )
+    assert sorted(end_tuples[0][0] for _, _, end_tuples in result) == sorted(ends)
+    for path, costs, end_tuples in result:
+        end = end_tuples[0][0]
+        assert tuple(path[-1]) == end
+        assert costs[-1] == pytest.approx(cum_costs[end], rel=1e-5)
+
+    # nearest end only
+    result = dijkstra(
+        _end_tuples([start])[0], _end_tuples(ends), cost_raster, True, feedback
+    )
+    assert len(result) == 1
+    nearest = min(ends, key=lambda end: cum_costs[end])
+    assert result[0][2][0][0] == nearest
+    assert result[0][1][-1] == pytest.approx(cum_costs[nearest], rel=1e-5)
+
+
+@pytest.mark.parametrize("feedback", [None, _Feedback()])
+def test_dijkstra_unreachable(cost_raster, feedback):
+    cost = cost_raster.copy()
+    cost[35:, 45:] = np.inf
+    cost[36:39, 46:49] = 1.0
+    start = (0, 0)
+
+    # end cell walled off by impassable cells
+    for find_nearest in (True, False):
+        result = dijkstra(
+            _end_tuples([start])[0],
+            _end_tuples([(37, 47)]),
+            cost,
+            find_nearest,
+            feedback,
+        )
+        assert result == []
+
+    # only reachable ends are returned
+    result = dijkstra(
+        _end_tuples([start])[0],
+        _end_tuples([(37, 47), (5, 45)]),
+        cost,
+        False,
+        feedback,
+    )
+    assert [end_tuples[0][0] for _, _, end_tuples in result] == [(5, 45)]
+
+    # impassable start cell
+    result = dijkstra(
+        _end_tuples([(35, 45)])[0], _end_tuples([(5, 45)]), cost, True, feedback
+    )
+    assert result == []
+
+
+@pytest.mark.parametrize("feedback", [None, _Feedback()])
+def test_dijkstra_start_is_end(cost_raster, feedback):
+    start = (5, 45)
+    result = dijkstra(
+        _end_tuples([start])[0], _end_tuples([start]), cost_raster, True, feedback
+    )
+
+    assert len(result) == 1
+    path, costs, _ = result[0]
+    assert [tuple(cell) for cell in path] == [start, start]
+    assert list(costs) == [0.0, 0.0]
+
+
+def _cell_line(cells, rows=40):
+    # cell centers of a raster with one unit cells and top left corner at (0, rows)
+    return sh_geom.LineString([(col + 0.5, rows - row - 0.5) for row, col in cells])
+
+
+@pytest.fixture
+def cost_meta():
+    return {"nodata": -9999.0, "transform": rasterio.Affine(1, 0, 0, 0, -1, 40)}
+
+
+# Cost raster with a nodata wall across all rows and a few nodata cells
+@pytest.fixture
+def nodata_cost_raster():
+    rng = np.random.default_rng(1)
+    cost = rng.uniform(1.0, 10.0, (40, 50)).astype(np.float32)
+    cost[rng.random(cost.shape) < 0.05] = -9999.0
+    cost[:, 25] = -9999.0
+    return cost
+
+
+# Shared batch search must give the same paths as find_least_cost_path
+def test_least_cost_paths_batch(nodata_cost_raster, cost_meta, monkeypatch):
+    cost = nodata_cost_raster
+    lines = [
+        _cell_line([(0, 0), (39, 49)]),
+        # starts next to the end of the first line and ends next to its start
+        _cell_line([(38, 48), (0, 1)]),
+        _cell_line([(10, 10), (12, 14)]),
+        # out of raster end point, nodata start cell, same start and end cell
+        _cell_line([(10, 10), (45, 10)]),
+        _cell_line([(20, 25), (30, 20)]),
+        sh_geom.LineString([(45.2, 4.8), (45.7, 4.3)]),
+        # the second line ends on the path of the first line
+        _cell_line([(0, 30), (0, 38)]),
+        _cell_line([(30, 33), (0, 34)]),
+    ]
+    expected = [find_least_cost_path(cost, cost_meta, line) for line in lines]
+
+    fallback = []
+    single_line_path = algo_dijkstra._single_line_path
+
+    def _count_fallback(padded, transformer, item, min_cost):
+        fallback.append(item[0])
+        return single_line_path(padded, transformer, item, min_cost)
+
+    monkeypatch.setattr(algo_dijkstra, "_single_line_path", _count_fallback)
+    lc_paths = find_least_cost_paths_batch(cost, cost_meta, lines)
+
+    # ends settled from the start of another line or shared paths through
+    # start or end cells of other lines fall back to a single search
+    assert {0, 1, 3, 6}.issubset(fallback)
+    assert 2 not in fallback and 4 not in fallback
+    assert len(lc_paths) == len(lines)
+    assert expected[5] is None and lc_paths[5] is None
+    for i, (lc_path, expected_path) in enumerate(zip(lc_paths, expected)):
+        if i == 5:
+            continue
+        assert expected_path is not None
+        assert lc_path.equals_exact(expected_path, 1e-6)
+
+
+# Left and right rings of a winding line overlap, both must keep shared cells
+def test_percentile_rings_overlap(tmp_path):
+    rng = np.random.default_rng(0)
+    chm = rng.uniform(0.0, 20.0, (100, 100)).astype(np.float32)
+    transform = rasterio.Affine(1, 0, 0, 0, -1, 100)
+    in_chm = tmp_path / "chm.tif"
+    with rasterio.open(
+        in_chm,
+        "w",
+        driver="GTiff",
+        height=100,
+        width=100,
+        count=1,
+        dtype="float32",
+        nodata=-9999,
+        transform=transform,
+    ) as dst:
+        dst.write(chm, 1)
+
+    line = sh_geom.LineString(
+        [(20, 40), (80, 40), (80, 50), (20, 50), (20, 60), (80, 60)]
+    )
+    line_info = LineInfo(line, None, in_chm.as_posix(), cell_size=1.0)
+    line_info.prepare_ring_buffer()
+    left = shapely.union_all([ring.geometry for ring in line_info.buffer_rings_left])
+    right = shapely.union_all(
+        [ring.geometry for ring in line_info.buffer_rings_right]
+    )
+    assert left.intersection(right).area > 100
+
+    # release the cached CHM dataset of the temporary file
+    try:
+        line_info.cal_percentile_rings()
+    finally:
+        algo_footprint_rel._close_chm()
+
+    for ring in line_info.buffer_rings_left + line_info.buffer_rings_right:
+        mask = rasterio.features.rasterize(
+            [(ring.geometry, 1)], out_shape=chm.shape, transform=transform
+        )
+        assert ring.percentile == pytest.approx(np.percentile(chm[mask == 1], 50))